@@ -1,3 +1,6 @@
+import os
+
+
 def init_settings(settings):
     settings.CHANNEL_HANDLER_CLASS = "athanor_channels.channelhandler.GlobalChannelHandler"
     settings.CMDSETS["ACCOUNT"].append("athanor_channels.cmdsets.AthanorAccountChannelCmdSet")
@@ -6,6 +9,29 @@ def init_settings(settings):
         'class': 'athanor_channels.controllers.AthanorChannelController'
     }
     settings.INSTALLED_APPS.append("athanor_channels")
+    settings.CHANNEL_HISTORY_SIZE = 200
+    settings.CHANNEL_HISTORY_DIR = os.path.join(settings.GAME_DIR, "server", "channel_history")
+    settings.CHANNEL_HISTORY_FLUSH_INTERVAL = 5
+    settings.CHANNEL_LOG_SEGMENT_SIZE = 4 * 1024 * 1024
+    settings.CHANNEL_LOG_SEGMENT_AGE = 86400
+    settings.CHANNEL_LOG_INDEX_INTERVAL = 64
+    # Seconds between saves of the Channel search indexes.
+    settings.CHANNEL_SEARCH_SAVE_INTERVAL = 600
+    settings.CHANNEL_CATCHUP_LIMIT = 50
+    settings.CHANNEL_DIGEST_INTERVAL = 300
+    settings.CHANNEL_SNAPSHOT_FILE = os.path.join(settings.GAME_DIR, "server", "channel_snapshot.pickle")
+    settings.CHANNEL_DELIVERY_CHUNK = 50
+    settings.CHANNEL_DELIVERY_SLICE = 0.01
+    # Seconds to hold Channel lines per session before sending them together. 0 disables.
+    settings.CHANNEL_COALESCE_WINDOW = 0
+    settings.CHANNEL_COALESCE_MAX_DELAY = 0.25
+    # Estimated Channel lines a session may have pending before it is degraded. 0 disables.
+    settings.CHANNEL_SESSION_BUDGET = 0
+    # Lines per second a session is assumed to drain.
+    settings.CHANNEL_SESSION_DRAIN_RATE = 20
+    settings.CHANNEL_BUDGET_POLICY = 'summarize'
+    # Newest lines held for a degraded session under 'drop_oldest'.
+    settings.CHANNEL_DEGRADED_KEEP = 10
     settings.CHANNEL_SYSTEMS = dict()
     settings.CHANNEL_SYSTEMS["account"] = {
         'name': "Account Channels",
@@ -0,0 +1,117 @@
+import heapq
+from datetime import datetime
+from itertools import count
+
+from django.utils import timezone
+from twisted.internet import reactor
+
+from athanor_channels.permissions import identity
+
+
+class BanIndex(object):
+    """
+    Remembers who is banned where in one Channel System.
+
+    Lookups are a dictionary hit. Bans with an expiry are also pushed onto a min-heap, and a
+    single reactor timer lifts them when the earliest one runs out. Lifting a ban drops the
+    System's cached positions and refreshes the affected listener indexes.
+
+    Users found to be banned nowhere in the System are remembered, so listing many Channels for
+    them needs no ban lookups at all. Banning or unbanning a user anywhere forgets that. Once
+    more than max_clean users are remembered, they are dropped and it starts over.
+    """
+    max_clean = 10000
+
+    def __init__(self, system):
+        self.system = system
+        # (entity identity, user identity) -> expiry datetime, True for no expiry, or False.
+        self.bans = dict()
+        self.expiries = list()
+        self._counter = count()
+        self._timer = None
+        # identities of users banned nowhere in the System.
+        self.clean = set()
+
+    def resolve(self, entity, user, compute):
+        if user is None or not hasattr(user, '_meta'):
+            return compute()
+        key = (identity(entity), identity(user))
+        if (found := self.bans.get(key, None)) is not None:
+            if not isinstance(found, datetime) or found > timezone.now():
+                return found
+        result = compute()
+        if isinstance(result, datetime):
+            if result <= timezone.now():
+                result = False
+            else:
+                self.schedule(result, key, entity, user)
+        self.bans[key] = result if isinstance(result, datetime) else bool(result)
+        return self.bans[key]
+
+    def banned_anywhere(self, entity, user):
+        """
+        Checks entity and all of its ancestors (Channel -> Category -> System).
+        """
+        while entity is not None:
+            if entity.is_banned(user):
+                return True
+            entity = None if entity is self.system else entity.parent
+        return False
+
+    def banned_map(self, user, channels):
+        """
+        is_banned_anywhere for many Channels at once. The first time a user is looked up, every
+        Category and Channel in the System is checked once; if they are banned nowhere, later
+        calls answer without checking anything.
+
+        Returns:
+            banned (dict): Channel -> bool
+        """
+        if user is None or not hasattr(user, '_meta'):
+            return {channel: self.banned_anywhere(channel, user) for channel in channels}
+        if (key := identity(user)) in self.clean:
+            return {channel: False for channel in channels}
+        hierarchy = self.system.hierarchy
+        if not any(self.banned_anywhere(entity, user)
+                   for entity in hierarchy.categories() + hierarchy.channels()):
+            if len(self.clean) >= self.max_clean:
+                self.clean.clear()
+            self.clean.add(key)
+        return {channel: self.banned_anywhere(channel, user) for channel in channels}
+
+    def forget(self, user):
+        """
+        Drops what is known about a user, after they are banned or unbanned anywhere in the System.
+        """
+        user_key = identity(user)
+        for key in [key for key in self.bans.keys() if key[1] == user_key]:
+            del self.bans[key]
+        self.clean.discard(user_key)
+
+    def schedule(self, expiry, key, entity, user):
+        heapq.heappush(self.expiries, (expiry, next(self._counter), key, entity, user))
+        if self.expiries[0][0] is expiry:
+            self._start_timer()
+
+    def _start_timer(self):
+        if not self.expiries:
+            return
+        delay = max((self.expiries[0][0] - timezone.now()).total_seconds(), 0)
+        if self._timer and self._timer.active():
+            self._timer.reset(delay)
+        else:
+            self._timer = reactor.callLater(delay, self.expire)
+
+    def expire(self):
+        now = timezone.now()
+        lifted = list()
+        while self.expiries and self.expiries[0][0] <= now:
+            expiry, idx, key, entity, user = heapq.heappop(self.expiries)
+            if self.bans.get(key, None) == expiry:
+                del self.bans[key]
+                lifted.append((entity, user))
+        if lifted:
+            self.system.position_cache.invalidate()
+            for entity, user in lifted:
+                entity.refresh_listeners(user)
+        self._start_timer()
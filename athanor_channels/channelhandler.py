@@ -1,44 +1,83 @@
-from django.db.models import Q
+from django.db import transaction
 
 from evennia.utils.ansi import ANSIString
+from evennia.utils.utils import delay
 
 from athanor.cmdsets.base import AthanorCmdSet
-from athanor.utils.text import partial_match
 from athanor_channels.models import AbstractChannelSubscription
+from athanor_channels.prefix import PrefixIndex
 
 
 class AbstractChannelHandler(object):
 
     def __init__(self, owner):
         self.owner = owner
-        self._cached = False
         self._cached_cmdset = None
-        self.update_cache()
+        # alias name index of subscriptions, and lowercase alias -> pooled Command.
+        self._aliases = PrefixIndex()
+        self._commands = dict()
 
     def system_msg(self, message):
         self.owner.msg(message, system_name=f"{self.namespace} Channels")
 
+    def get_command(self, subscription, system=None):
+        channel = subscription.db_channel
+        if system is None:
+            system = channel.system
+        return system.ndb.command_pool.get(channel, subscription.db_name)
+
     def update_cache(self):
+        """
+        Builds the channel cmdset from scratch. After this, add/leave keep it current one
+        command at a time.
+        """
         cmdset = AthanorCmdSet()
         cmdset.key = "ChannelCmdSet"
         cmdset.priority = 101
         cmdset.duplicates = True
-        for subscription in self.subscriptions.all():
-            system = subscription.db_channel.system
-            cmd = system.ndb.command_class(
-                key=subscription.db_name,
-                locks="cmd:all();%s" % subscription.db_channel.locks,
-                subscription=subscription
-            )
+        self._aliases = PrefixIndex()
+        self._commands = dict()
+        systems = dict()
+        for subscription in self.subscriptions.all().select_related('db_channel'):
+            channel_id = subscription.db_channel_id
+            if (system := systems.get(channel_id, None)) is None:
+                system = systems[channel_id] = subscription.db_channel.system
+            cmd = self.get_command(subscription, system)
+            alias = subscription.db_name.lower()
+            self._aliases.add(alias, subscription)
+            self._commands[alias] = cmd
             cmdset.add(cmd)
         self._cached_cmdset = cmdset
-        self._cached = True
 
     def cmdset(self):
-        if not self._cached:
+        if self._cached_cmdset is None:
             self.update_cache()
         return self._cached_cmdset
 
+    def get_alias(self, alias):
+        """
+        Exact, case-insensitive lookup of a subscription by alias. Used by the alias Commands.
+        """
+        self.cmdset()
+        return self._aliases.get(alias)
+
+    def add_command(self, subscription):
+        if self._cached_cmdset is None:
+            return
+        cmd = self.get_command(subscription)
+        alias = subscription.db_name.lower()
+        self._aliases.add(alias, subscription)
+        self._commands[alias] = cmd
+        self._cached_cmdset.add(cmd)
+
+    def remove_command(self, subscription):
+        if self._cached_cmdset is None:
+            return
+        alias = subscription.db_name.lower()
+        self._aliases.remove(alias)
+        if (cmd := self._commands.pop(alias, None)):
+            self._cached_cmdset.remove(cmd)
+
     @property
     def subscriptions(self):
         return self.owner.channel_subscriptions
@@ -46,21 +85,54 @@ class AbstractChannelHandler(object):
     def add(self, channel, alias):
         if (found := self.subscriptions.filter(db_namespace=self.namespace, db_name=alias).first()):
             raise ValueError(f"That conflicts with an existing alias to {found.db_channel}!")
-        self.subscriptions.create(db_namespace=self.namespace, db_channel=channel, db_name=alias)
-        self.update_cache()
+        subscription = self.subscriptions.create(db_namespace=self.namespace, db_channel=channel, db_name=alias)
+        channel.listener_index.add_subscription(subscription)
+        self.add_command(subscription)
+
+    def add_many(self, subscribe):
+        """
+        Subscribes the owner to many Channels at once, such as the defaults for a new player.
+        Aliases already in use are skipped rather than raising.
+
+        Args:
+            subscribe (list): (channel, alias) pairs.
+
+        Returns:
+            result (tuple): (new subscriptions, aliases skipped)
+        """
+        wanted = dict()
+        for channel, alias in subscribe:
+            wanted.setdefault(alias, channel)
+        taken = set(self.subscriptions.filter(db_namespace=self.namespace,
+                                              db_name__in=list(wanted.keys())).values_list('db_name', flat=True))
+        skipped = [alias for alias in wanted.keys() if alias in taken]
+        if not (joining := {alias: channel for alias, channel in wanted.items() if alias not in taken}):
+            return list(), skipped
+        model = self.subscriptions.model
+        with transaction.atomic():
+            model.objects.bulk_create([model(**{model.owner_field: self.owner}, db_namespace=self.namespace,
+                                             db_channel=channel, db_name=alias)
+                                       for alias, channel in joining.items()])
+        created = list(self.subscriptions.filter(db_namespace=self.namespace,
+                                                 db_name__in=list(joining.keys())).select_related('db_channel'))
+        for subscription in created:
+            subscription.db_channel.listener_index.add_subscription(subscription)
+            self.add_command(subscription)
+        return created, skipped
 
     def find_alias(self, alias):
         if isinstance(alias, AbstractChannelSubscription):
             return alias
-        aliases = self.subscriptions.filter(db_namespace=self.namespace)
-        if not (found := partial_match(alias, aliases)):
+        self.cmdset()
+        if not (found := self._aliases.find(alias, lambda sub: sub.db_namespace == self.namespace)):
             raise ValueError(f"Channel Alias not found: {alias}!")
         return found
 
     def leave(self, alias):
         found = self.find_alias(alias)
+        found.db_channel.listener_index.remove_subscription(found)
+        self.remove_command(found)
         found.delete()
-        self.update_cache()
 
     def codename(self, alias, codename):
         found = self.find_alias(alias)
@@ -88,13 +160,15 @@ class AbstractChannelHandler(object):
         if not title:
             raise ValueError("Must include a title!")
         if title.lower() == 'none':
-            found.db_altname = None
+            found.db_title = None
             found.save(update_fields=['db_title'])
+            self.check_listen(found)
             self.system_msg("Title cleared!")
             return
         title = ANSIString(title)
         found.db_title = title
         found.save(update_fields=['db_title'])
+        self.check_listen(found)
         self.system_msg(f"Title set to: {title}")
 
     def altname(self, alias, altname):
@@ -104,31 +178,88 @@ class AbstractChannelHandler(object):
         if altname.lower() == 'none':
             found.db_altname = None
             found.save(update_fields=['db_altname'])
+            self.check_listen(found)
             self.system_msg("Codename cleared!")
             return
         altname = ANSIString(altname)
         found.db_altname = altname
         found.save(update_fields=['db_altname'])
+        # The preferred alias for delivery favours one with an altname.
+        self.check_listen(found)
         self.system_msg(f"Altname set to: {altname}")
 
-    def check_listen(self, channel):
-        all_aliases = self.subscriptions.filter(db_channel=channel)
-        listening = True if self.owner in channel.listeners else False
-        # If listening and shouldn't be...
-        permission = channel.is_position(self.owner, 'listener')
-        if listening:
-            if not permission or not all_aliases.filter(Q(db_muted=False) | Q(db_enabled=True)).count():
-                channel.remove_listener(self.owner)
-        else:
-            if permission and all_aliases.filter(Q(db_muted=False) | Q(db_enabled=True)).count():
-                channel.add_listener(self.owner)
+    def check_listen(self, subscription):
+        subscription.db_channel.listener_index.update_subscription(subscription)
+
+    def update_online(self):
+        """
+        Tells every channel this owner is subscribed to whether the owner has sessions.
+        """
+        online = bool(self.owner.sessions.count())
+        subscriptions = self.subscriptions.filter(db_namespace=self.namespace).select_related('db_channel')
+        for channel in {sub.db_channel for sub in subscriptions}:
+            channel.listener_index.set_online(self.owner, online)
+
+    def catchup_subscriptions(self):
+        return self.subscriptions.filter(db_namespace=self.namespace, db_catchup=True).select_related('db_channel')
+
+    def catch_up(self):
+        """
+        Sends each catch-up subscription what was said on its Channel while the owner was away.
+        """
+        for subscription in self.catchup_subscriptions():
+            channel = subscription.db_channel
+            if (text := channel.render_catchup(self.owner, subscription)):
+                self.owner.msg(text)
+            subscription.last_seen = channel.history.latest_id()
+
+    def mark_seen(self):
+        """
+        Records how far each catch-up subscription has read, as the owner goes offline.
+        """
+        for subscription in self.catchup_subscriptions():
+            if (latest := subscription.db_channel.history.latest_id()) != subscription.db_last_seen:
+                subscription.last_seen = latest
+
+    def at_connect(self):
+        self.update_online()
+        # Only when coming online. Further sessions have been receiving everything live.
+        if self.owner.sessions.count() == 1:
+            self.catch_up()
+
+    def at_disconnect(self):
+        self.mark_seen()
+        # The disconnecting session is still registered while the disconnect hooks run.
+        delay(0, self.update_online)
+
+    def catchup(self, alias):
+        found = self.find_alias(alias)
+        if found.catchup:
+            found.catchup = False
+            self.system_msg("You will no longer be caught up on this channel when you log in.")
+            return
+        found.last_seen = found.db_channel.history.latest_id()
+        found.catchup = True
+        self.system_msg("You will be shown messages you missed on this channel when you log in.")
+
+    def digest(self, alias):
+        found = self.find_alias(alias)
+        if found.digest:
+            found.digest = False
+            self.check_listen(found)
+            self.system_msg("You will receive this channel's messages as they are sent.")
+            return
+        found.digest_seen = found.db_channel.history.latest_id()
+        found.digest = True
+        self.check_listen(found)
+        self.system_msg("You will receive a periodic summary of this channel instead of its messages.")
 
     def mute(self, alias):
         found = self.find_alias(alias)
         if found.muted:
             raise ValueError("Channel is already muted!")
         found.muted = True
-        self.check_listen(found.db_channel)
+        self.check_listen(found)
         self.system_msg("Muted the channel!")
 
     def unmute(self, alias):
@@ -136,7 +267,7 @@ class AbstractChannelHandler(object):
         if not found.muted:
             raise ValueError("Channel is not muted!")
         found.muted = False
-        self.check_listen(found.db_channel)
+        self.check_listen(found)
         self.system_msg("un-Muted the channel!")
 
     def on(self, alias):
@@ -144,7 +275,7 @@ class AbstractChannelHandler(object):
         if found.enabled:
             raise ValueError("Channel is already on!")
         found.enabled = True
-        self.check_listen(found.db_channel)
+        self.check_listen(found)
         self.system_msg("Turned channel on!")
 
     def off(self, alias):
@@ -152,7 +283,7 @@ class AbstractChannelHandler(object):
         if not found.enabled:
             raise ValueError("Channel is not on!")
         found.enabled = False
-        self.check_listen(found.db_channel)
+        self.check_listen(found)
         self.system_msg("Turned channel on!")
 
 
@@ -12,6 +12,7 @@ class HasAccountUser(object):
 
 
 class AccountChannel(HasAccountUser, AbstractChannel):
+    namespace = 'account'
 
     def get_sender(self, sending_session=None):
         if not sending_session:
@@ -1,18 +1,33 @@
 import re
-from collections import defaultdict
-from django.db.models import Q
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
 from evennia.comms.comms import DefaultChannel
+from evennia.comms.models import ChannelDB
+from evennia.scripts.models import ScriptDB
 from evennia.utils.ansi import ANSIString
+from django.conf import settings
 from evennia.utils.utils import lazy_property, class_from_module
 from evennia.utils.logger import log_trace
 
 from athanor.gamedb.scripts import AthanorOptionScript
-from athanor.utils.text import partial_match
 from athanor.gamedb.base import HasRenderExamine, HasOps
+from athanor.utils.text import Speech
 
 from athanor_channels.models import ChannelSystemBridge, ChannelCategoryBridge, ChannelBridge
 from athanor_channels import messages as cmsg
 from athanor_channels.commands.base import AbstractChannelCommand
+from athanor_channels.listeners import ChannelListenerIndex, build_indexes
+from athanor_channels.commandpool import ChannelCommandPool
+from athanor_channels.hierarchy import ChannelHierarchy
+from athanor_channels.permissions import PositionCache
+from athanor_channels.bans import BanIndex
+from athanor_channels.history import ChannelHistory
+from athanor_channels.search import SearchQuery
+from athanor_channels.delivery import DELIVERY_QUEUE
+from athanor_channels.ratelimit import ChannelRateLimiter, parse_rate
 
 
 class HasChanOps(HasOps, HasRenderExamine):
@@ -26,6 +41,8 @@ class HasChanOps(HasOps, HasRenderExamine):
     lock_msg = cmsg.Lock
     config_msg = cmsg.Config
     desc_msg = cmsg.Describe
+    rate_options = ('speaker_rate', 'channel_rate')
+    op_messages = ('grant_msg', 'revoke_msg', 'ban_msg', 'unban_msg', 'lock_msg', 'config_msg', 'desc_msg')
 
     def render_examine(self, viewer, callback=True):
         return self.render_examine_callback(None, viewer, callback=callback)
@@ -38,6 +55,20 @@ class HasChanOps(HasOps, HasRenderExamine):
     def parent_position(self, user, position):
         return self.parent.check_position(user, position)
 
+    @contextmanager
+    def quiet(self):
+        """
+        Silences this entity's per-operation admin messages, for bulk operations that send a
+        single summary instead.
+        """
+        for attr in self.op_messages:
+            setattr(self, attr, cmsg.Silent)
+        try:
+            yield self
+        finally:
+            for attr in self.op_messages:
+                self.__dict__.pop(attr, None)
+
     @property
     def description(self):
         return self.db.desc
@@ -52,6 +83,106 @@ class HasChanOps(HasOps, HasRenderExamine):
         entities = {'enactor': enactor, 'target': self}
         self.desc_msg(entities, old_desc=old_desc, new_desc=new_description)
 
+    def listener_channels(self):
+        """
+        Returns the Channels whose listeners are affected by permission changes on this entity.
+        """
+        return list()
+
+    def refresh_listeners(self, user=None):
+        for channel in self.listener_channels():
+            channel.listener_index.refresh(user)
+
+    @property
+    def position_cache(self):
+        return self.system.position_cache
+
+    def is_position(self, user, position):
+        return self.position_cache.resolve('is_position', self, user, position,
+                                           lambda: super(HasChanOps, self).is_position(user, position))
+
+    def check_position(self, user, position):
+        return self.position_cache.resolve('check_position', self, user, position,
+                                           lambda: super(HasChanOps, self).check_position(user, position))
+
+    @property
+    def ban_index(self):
+        return self.system.ban_index
+
+    def is_banned(self, user):
+        return self.ban_index.resolve(self, user, lambda: super(HasChanOps, self).is_banned(user))
+
+    def is_banned_anywhere(self, user):
+        """
+        True if the user is banned from this entity or anything above it in the hierarchy.
+        """
+        return self.ban_index.banned_anywhere(self, user)
+
+    def at_ops_change(self, user=None):
+        """
+        Called after anything that can change who holds which position here or below.
+        """
+        self.position_cache.invalidate()
+        self.refresh_listeners(user)
+
+    def grant(self, session, user, position):
+        result = super().grant(session, user, position)
+        self.at_ops_change(self.find_user(session, user))
+        return result
+
+    def revoke(self, session, user, position):
+        result = super().revoke(session, user, position)
+        self.at_ops_change(self.find_user(session, user))
+        return result
+
+    def ban(self, session, user, duration):
+        result = super().ban(session, user, duration)
+        user = self.find_user(session, user)
+        self.ban_index.forget(user)
+        self.at_ops_change(user)
+        return result
+
+    def unban(self, session, user):
+        result = super().unban(session, user)
+        user = self.find_user(session, user)
+        self.ban_index.forget(user)
+        self.at_ops_change(user)
+        return result
+
+    def lock(self, session, lock_data):
+        result = super().lock(session, lock_data)
+        self.at_ops_change()
+        return result
+
+    def config(self, session, config_op, config_val):
+        if config_op.lower() in self.rate_options:
+            result = self.config_rate(session, config_op.lower(), config_val)
+        else:
+            result = super().config(session, config_op, config_val)
+        self.position_cache.invalidate()
+        return result
+
+    def config_rate(self, session, config_op, config_val):
+        """
+        Sets or clears a flood-control limit. Channels inherit limits from their Category and
+        System unless they set their own.
+        """
+        if not (enactor := self.get_enactor(session)) or not self.check_position(enactor, 'operator'):
+            raise ValueError("Permission denied.")
+        if (limit := parse_rate(config_val)):
+            self.attributes.add(config_op, limit, category='channel_rate')
+            config_val = f"{limit[0]} messages per {limit[1]:g} seconds"
+        else:
+            self.attributes.remove(config_op, category='channel_rate')
+            config_val = 'inherited'
+        entities = {'enactor': enactor, 'target': self}
+        self.config_msg(entities, config_op=config_op, config_val=config_val)
+
+    def rate_limit(self, option):
+        if (limit := self.attributes.get(option, category='channel_rate')) is not None:
+            return limit
+        return self.parent.rate_limit(option)
+
 
 class AbstractChannel(HasChanOps, DefaultChannel):
     """
@@ -63,6 +194,8 @@ class AbstractChannel(HasChanOps, DefaultChannel):
     lockstring = "listener:all();speaker:();moderator:pperm(Moderator);operator:pperm(Admin)"
     lock_options = ['listener', 'speaker', 'moderator', 'operator']
     access_hierarchy = ['listener', 'speaker', 'moderator', 'operator']
+    search_page_size = 20
+    color_options = ('quotes_channel', 'speech_channel', 'speaker_channel', 'self_channel', 'other_channel')
     access_breakdown = {
         'listener': dict(),
         'speaker': dict(),
@@ -80,7 +213,9 @@ class AbstractChannel(HasChanOps, DefaultChannel):
 
     @property
     def fullname(self):
-        return f"{self.system}/{self.category.cname}/{self.cname}"
+        if (fullname := self.system.hierarchy.fullname(self)) is None:
+            fullname = f"{self.system}/{self.category.cname}/{self.cname}"
+        return fullname
 
     def generate_substitutions(self, viewer):
         return {"name": self.key,
@@ -94,7 +229,9 @@ class AbstractChannel(HasChanOps, DefaultChannel):
 
     @property
     def category(self):
-        return self.bridge.db_category.db_script
+        if (category := self.ndb.category) is None:
+            category = self.ndb.category = self.bridge.db_category.db_script
+        return category
 
     @property
     def system(self):
@@ -111,18 +248,31 @@ class AbstractChannel(HasChanOps, DefaultChannel):
                                      db_category=category.channel_category_bridge, db_unique_key=unique_key)
 
     @classmethod
-    def create_channel(cls, category, key, unique_key=None):
+    def clean_channel_name(cls, category, key):
+        """
+        Validates a new Channel name for a Category.
+
+        Returns:
+            names (tuple): (raw ANSI name, clean name)
+        """
         key = ANSIString(key)
         clean_key = str(key.clean())
         if '|' in clean_key:
             raise ValueError("Malformed ANSI in Channel Name.")
         if not cls.re_name.match(clean_key):
             raise ValueError("Channel Names must be EXPLANATION HERE.")
-        if category.channel_category_bridge.channels.filter(db_iname=clean_key.lower()).count():
+        if category.system.hierarchy.channel_named(category, clean_key):
             raise ValueError("Name conflicts with another Channel.")
+        return key.raw(), clean_key
+
+    @classmethod
+    def create_channel(cls, category, key, unique_key=None):
+        raw_key, clean_key = cls.clean_channel_name(category, key)
+        hierarchy = category.system.hierarchy
         channel, errors = cls.create(clean_key)
         if channel:
-            channel.create_bridge(category, key.raw(), clean_key, unique_key)
+            channel.create_bridge(category, raw_key, clean_key, unique_key)
+            hierarchy.invalidate()
         else:
             raise ValueError(errors)
         return channel
@@ -153,8 +303,15 @@ class AbstractChannel(HasChanOps, DefaultChannel):
         bridge.db_iname = clean_key.lower()
         bridge.db_cname = key.raw()
         bridge.save(update_fields=['db_name', 'db_iname', 'db_cname'])
+        self.system.hierarchy.invalidate()
         return key
 
+    def delete(self):
+        hierarchy = self.system.hierarchy
+        result = super().delete()
+        hierarchy.invalidate()
+        return result
+
     def __str__(self):
         return str(self.key)
 
@@ -163,27 +320,265 @@ class AbstractChannel(HasChanOps, DefaultChannel):
             return None
         return sending_session.get_puppet_or_account()
 
-    def render_prefix(self, recipient, sender):
+    def lock(self, session, lock_data):
+        result = super().lock(session, lock_data)
+        self.system.ndb.command_pool.refresh_locks(self)
+        return result
+
+    def render_prefix(self, recipient, sender, subscription=None):
+        if subscription and subscription.db_altname:
+            return f"<{subscription.db_altname}>"
         return f"<{self.bridge.cname}>"
 
+    def render_options(self, recipient):
+        """
+        Returns the OptionHandler that holds the recipient's channel colors.
+        """
+        return recipient.options
+
+    def render_key(self, recipient, sender, subscription):
+        """
+        Everything that can make one recipient's view of a message differ from another's.
+        Recipients sharing a key are sent the same rendered text.
+        """
+        colors = None
+        if (options := self.render_options(recipient)):
+            colors = tuple(options.get(op) for op in self.color_options)
+        return (recipient == sender, subscription.db_altname, colors)
+
+    def render_message(self, text, recipient, sender, subscription):
+        return f"{self.render_prefix(recipient, sender, subscription)} {text.render(viewer=recipient)}"
+
+    @lazy_property
+    def listener_index(self):
+        return ChannelListenerIndex(self)
+
+    def listener_channels(self):
+        return [self]
+
     def allowed_listeners(self):
-        subscriptions = self.subscriptions.exclude(Q(db_muted=True) | Q(db_enabled=False))
-        return {sub for sub in subscriptions if self.check_position(sub.owner, 'listener')}
+        return self.listener_index.allowed_listeners()
+
+    def listener_stats(self):
+        """
+        Cheap occupancy numbers for listings and dashboards. Never touches the database once the
+        listener index is built.
+
+        Returns:
+            stats (dict): {'allowed': <int>, 'online': <int>}
+        """
+        return self.listener_index.stats()
 
     def active_listeners(self, allowed=None):
         if allowed is None:
-            allowed = self.allowed_listeners()
-        return {sub for sub in allowed if sub.owner.sessions.count()}
+            return self.listener_index.active_listeners()
+        online = self.listener_index.online
+        return {sub for sub in allowed if sub.owner in online}
+
+    @lazy_property
+    def stats(self):
+        return Counter()
+
+    @lazy_property
+    def history(self):
+        return ChannelHistory(self)
+
+    def record(self, text):
+        """
+        Adds a Speech to the Channel's scrollback.
+        """
+        codename = str(text.alternate_name) if text.alternate_name else None
+        title = str(text.title) if text.title else None
+        return self.history.append(text.speaker, codename, title, str(text.speech_text))
+
+    @lazy_property
+    def rate_limiter(self):
+        return ChannelRateLimiter(self)
+
+    def check_rate(self, speaker):
+        """
+        Flood control, checked before a message is built. Moderators and up are exempt.
+        """
+        if self.check_position(speaker, 'moderator') or self.rate_limiter.allow(speaker):
+            return
+        self.stats['rate_limited'] += 1
+        raise ValueError("You are sending messages too quickly. Slow down!")
+
+    def subscribe_many(self, owners, alias):
+        """
+        Subscribes many owners to this Channel under the same alias, with one query to find
+        clashing aliases, one bulk insert, and one in-memory update per owner.
+
+        Args:
+            owners (list): Accounts or Characters, to match the Channel.
+            alias (str): The alias to give them.
+
+        Returns:
+            result (tuple): (new subscriptions, owners skipped because the alias was taken)
+        """
+        model = self.subscriptions.model
+        owner_field = model.owner_field
+        owners = list({owner.pk: owner for owner in owners}.values())
+        taken = set(model.objects.filter(**{f"{owner_field}__in": owners}, db_namespace=self.namespace,
+                                         db_name=alias).values_list(f"{owner_field}_id", flat=True))
+        skipped = [owner for owner in owners if owner.pk in taken]
+        if not (joining := [owner for owner in owners if owner.pk not in taken]):
+            return list(), skipped
+        with transaction.atomic():
+            model.objects.bulk_create([model(**{owner_field: owner}, db_namespace=self.namespace, db_channel=self,
+                                             db_name=alias) for owner in joining])
+        # Not every database backend returns primary keys from bulk_create.
+        created = list(model.objects.filter(**{f"{owner_field}__in": joining}, db_namespace=self.namespace,
+                                            db_name=alias, db_channel=self).select_related(owner_field))
+        for subscription in created:
+            self.listener_index.add_subscription(subscription)
+            subscription.owner.channels.add_command(subscription)
+        return created, skipped
+
+    def unsubscribe_all(self):
+        """
+        Removes every alias to this Channel with one delete.
+
+        Returns:
+            count (int): Subscriptions removed.
+        """
+        subscriptions = list(self.subscriptions.select_related(self.subscriptions.model.owner_field))
+        for subscription in subscriptions:
+            subscription.owner.channels.remove_command(subscription)
+        self.subscriptions.all().delete()
+        self.listener_index.clear()
+        return len(subscriptions)
+
+    def user_model(self):
+        model = self.subscriptions.model
+        return model._meta.get_field(model.owner_field).related_model
+
+    def render_history(self, viewer, count, controller=None):
+        """
+        Renders the last count messages, at most CHANNEL_HISTORY_SIZE, for a current listener.
+        """
+        if not self.check_position(viewer, 'listener') or self.is_banned_anywhere(viewer):
+            raise ValueError("Permission denied.")
+        if not (entries := self.history.last(min(count, settings.CHANNEL_HISTORY_SIZE))):
+            raise ValueError("Nothing has been said on this channel yet!")
+        return self.render_entries(viewer, entries, controller)
+
+    def render_catchup(self, viewer, subscription, controller=None):
+        """
+        Renders what was said since the subscription last saw the Channel. Message ids are
+        sequential, so this only reads the missed messages, and at most CHANNEL_CATCHUP_LIMIT.
+
+        Returns:
+            text (str or None): None if nothing was missed, or the viewer may not hear it.
+        """
+        if subscription.db_muted or not subscription.db_enabled:
+            return None
+        if not self.check_position(viewer, 'listener') or self.is_banned_anywhere(viewer):
+            return None
+        if (missed := self.history.latest_id() - subscription.db_last_seen) <= 0:
+            return None
+        entries = self.history.last(min(missed, settings.CHANNEL_CATCHUP_LIMIT))
+        lines = [f"{self.render_prefix(viewer, None, subscription)} {missed} message{'s' if missed != 1 else ''} "
+                 f"since you were last here:"]
+        if missed > len(entries):
+            lines.append(f"({missed - len(entries)} older messages not shown. Use /last to see more.)")
+        lines.append(self.render_entries(viewer, entries, controller, subscription))
+        return "\n".join(lines)
+
+    def render_digest(self, viewer, subscription, count, last):
+        name = last['codename'] or last['speaker'] or 'Unknown'
+        return f"{self.render_prefix(viewer, None, subscription)} {count} message{'s' if count != 1 else ''} " \
+               f"on {self.fullname}, last from {name}."
+
+    def send_digests(self):
+        """
+        Called by the DigestScheduler. Tells each online digest listener how much was said since
+        their last digest. Marks are saved with one bulk update, so they survive reloads.
+
+        Returns:
+            sent (int): Digests sent.
+        """
+        index = self.listener_index
+        latest = self.history.latest_id()
+        last = None
+        sent = 0
+        marked = list()
+        for owner, subscription in list(index.digesting.items()):
+            if owner not in index.online:
+                continue
+            if not subscription.db_digest_seen:
+                # Digest mode from before marks were kept. Start counting from now.
+                subscription.db_digest_seen = latest
+                marked.append(subscription)
+                continue
+            if (count := latest - subscription.db_digest_seen) <= 0:
+                continue
+            if last is None:
+                last = self.history.last(1)[0]
+            owner.msg(self.render_digest(owner, subscription, count, last))
+            subscription.db_digest_seen = latest
+            marked.append(subscription)
+            sent += 1
+        if marked:
+            self.subscriptions.model.objects.bulk_update(marked, ['db_digest_seen'])
+        self.stats['digests'] += sent
+        return sent
+
+    def render_entries(self, viewer, entries, controller=None, subscription=None):
+        speaker_ids = {entry['speaker_id'] for entry in entries if entry['speaker_id']}
+        speakers = self.user_model().objects.in_bulk(speaker_ids)
+        prefix = self.render_prefix(viewer, None, subscription)
+        lines = list()
+        for entry in entries:
+            stamp = time.strftime('%m/%d %H:%M', time.localtime(entry['time']))
+            if (speaker := speakers.get(entry['speaker_id'], None)):
+                speech = Speech(speaker=speaker, speech_text=entry['text'], mode="channel", title=entry['title'],
+                                alternate_name=entry['codename'], controller=controller)
+                body = speech.render(viewer=viewer)
+            else:
+                body = f"{entry['speaker']}: {entry['text']}"
+            lines.append(f"[{stamp}] {prefix} {body}")
+        return "\n".join(str(line) for line in lines)
+
+    def search_history(self, session, terms):
+        if not (enactor := self.get_enactor(session)) or not self.check_position(enactor, 'moderator'):
+            raise ValueError("Permission denied.")
+        query = SearchQuery(terms)
+        results, more = self.history.search.search(query, per_page=self.search_page_size)
+        if not results:
+            raise ValueError("No messages found!")
+        styling = enactor.styler
+        message = list()
+        message.append(styling.styled_header(f"Search Results: {self.fullname} - Page {query.page}"))
+        for entry in results:
+            stamp = time.strftime('%Y/%m/%d %H:%M', time.localtime(entry['time']))
+            name = f"{entry['codename']} ({entry['speaker']})" if entry['codename'] else entry['speaker']
+            message.append(f"#{entry['id']} [{stamp}] {name}: {entry['text']}")
+        if more:
+            message.append(f"More results: add page:{query.page + 1} to your search.")
+        message.append(styling.blank_footer)
+        return "\n".join(str(l) for l in message)
+
+    def reindex(self, session):
+        if not (enactor := self.get_enactor(session)) or not self.check_position(enactor, 'operator'):
+            raise ValueError("Permission denied.")
+        self.history.search.rebuild().addCallback(
+            lambda result: enactor.msg(f"Finished re-indexing the history of {self.fullname}."))
+        return f"Re-indexing the history of {self.fullname}. This may take a while."
 
     def broadcast(self, text, sending_session=None):
+        """
+        Records the message and queues it for delivery, once per owner no matter how many aliases
+        they have. Recipients are fixed now; rendering and sending happen on the reactor in the
+        DeliveryQueue.
+        """
         sender = self.get_sender(sending_session)
-        for subscription in self.active_listeners():
-            owner = subscription.owner
-            prefix = self.render_prefix(owner, sender)
-            owner.msg(f"{prefix} {text.render(viewer=owner)}")
+        self.record(text)
+        DELIVERY_QUEUE.enqueue(self, text, sender, self.listener_index.active_deliveries())
 
     def check_access(self, checker, lock):
-        return self.access(checker, lock) or self.category.access(checker, lock)
+        return self.position_cache.resolve('check_access', self, checker, lock,
+                                           lambda: self.access(checker, lock) or self.category.access(checker, lock))
 
 
 class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
@@ -197,7 +592,9 @@ class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
 
     @property
     def fullname(self):
-        return f"{self.system}/{self.bridge.cname}"
+        if (fullname := self.system.hierarchy.fullname(self)) is None:
+            fullname = f"{self.system}/{self.bridge.cname}"
+        return fullname
 
     def generate_substitutions(self, viewer):
         return {"name": str(self),
@@ -214,7 +611,9 @@ class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
 
     @property
     def system(self):
-        return self.bridge.db_system.db_script
+        if (system := self.ndb.system) is None:
+            system = self.ndb.system = self.bridge.db_system.db_script
+        return system
 
     @property
     def parent(self):
@@ -236,11 +635,12 @@ class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
             raise ValueError("Malformed ANSI in Channel Category Name.")
         if not cls.re_name.match(clean_key):
             raise ValueError("Channel Category names must be EXPLANATION.")
-        if chan_sys.channel_system_bridge.channel_categories.filter(db_iname=clean_key.lower()).count():
+        if chan_sys.hierarchy.category_named(clean_key):
             raise ValueError("Name conflicts with another Channel Category.")
         script, errors = cls.create(clean_key, persistent=True)
         if script:
             script.create_bridge(chan_sys, key.raw(), clean_key)
+            chan_sys.hierarchy.invalidate()
         else:
             raise ValueError(errors)
         return script
@@ -271,10 +671,20 @@ class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
         bridge.db_iname = clean_key.lower()
         bridge.db_cname = key.raw()
         bridge.save(update_fields=['db_name', 'db_iname', 'db_cname'])
+        self.system.hierarchy.invalidate()
         return key
 
+    def delete(self):
+        hierarchy = self.system.hierarchy
+        result = super().delete()
+        hierarchy.invalidate()
+        return result
+
     def channels(self):
-        return [c.db_channel for c in self.bridge.channels.all()]
+        return self.system.hierarchy.channels(self)
+
+    def listener_channels(self):
+        return self.channels()
 
     def visible_channels(self, session):
         return [channel for channel in self.channels() if channel.access(session, 'listen')]
@@ -284,12 +694,13 @@ class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
             return name
         if isinstance(name, ChannelBridge):
             return name.db_channel
-        if (found := partial_match(name, self.visible_channels(user))):
+        if (found := self.system.hierarchy.find_channel(self, name, lambda chan: chan.access(user, 'listen'))):
             return found
         raise ValueError(f"Cannot Find Channel: {name}")
 
     def check_access(self, checker, lock):
-        return self.access(checker, lock) or self.system.access(checker, lock)
+        return self.position_cache.resolve('check_access', self, checker, lock,
+                                           lambda: self.access(checker, lock) or self.system.access(checker, lock))
 
     def create_channel(self, session, name):
         if not (enactor := self.get_enactor(session)) or not self.check_position(enactor, 'operator'):
@@ -368,6 +779,18 @@ class AbstractChannelCategory(HasChanOps, AthanorOptionScript):
         channel = self.find_channel(enactor, name)
         return channel.examine(session)
 
+    def search_channel(self, session, name, terms):
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        channel = self.find_channel(enactor, name)
+        return channel.search_history(session, terms)
+
+    def reindex_channel(self, session, name):
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        channel = self.find_channel(enactor, name)
+        return channel.reindex(session)
+
     def describe_channel(self, session, name, description):
         if not (enactor := self.get_enactor(session)):
             raise ValueError("Permission denied.")
@@ -387,10 +810,29 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
     def __str__(self):
         return str(self.key)
 
+    @property
+    def hierarchy(self):
+        if (hierarchy := self.ndb.hierarchy) is None:
+            hierarchy = self.ndb.hierarchy = ChannelHierarchy(self)
+        return hierarchy
+
+    @property
+    def position_cache(self):
+        if (cache := self.ndb.position_cache) is None:
+            cache = self.ndb.position_cache = PositionCache()
+        return cache
+
+    @property
+    def ban_index(self):
+        if (index := self.ndb.ban_index) is None:
+            index = self.ndb.ban_index = BanIndex(self)
+        return index
+
     def at_start(self):
         if not hasattr(self, 'channel_system_bridge'):
             return
         bri = self.channel_system_bridge
+        self.ndb.hierarchy = ChannelHierarchy(self)
 
         # Some safeguards are set here but they're really not how this works. These
         # imports are really not allowed to fail.
@@ -412,15 +854,49 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
         except Exception:
             log_trace()
             self.ndb.command_class = AbstractChannelCommand
+        # Kept across at_start calls: Commands already in cmdsets belong to this pool, and
+        # refresh_locks can only reach them through it.
+        if (pool := self.ndb.command_pool) is None:
+            self.ndb.command_pool = ChannelCommandPool(self.ndb.command_class)
+        else:
+            pool.command_class = self.ndb.command_class
 
         # This ensures that all categories and channels in this system will be using the proper
         # typeclass.
-        for category in self.categories():
-            if not category.is_typeclass(self.ndb.category_typeclass, exact=True):
-                category.swap_typeclass(self.ndb.category_typeclass)
-            for channel in category.channels():
-                if not channel.is_typeclass(self.ndb.channel_typeclass, exact=True):
-                    channel.swap_typeclass(self.ndb.channel_typeclass)
+        touched = self.reconcile_typeclasses()
+        # at_start can run several times per boot (Evennia, integrity_check, do_load), and only the
+        # first pass finds anything, so the startup report needs the running total.
+        previous = self.ndb.reconciled or (0, 0)
+        self.ndb.reconciled = (previous[0] + touched[0], previous[1] + touched[1])
+
+    def reconcile_typeclasses(self):
+        """
+        Points every Category and Channel of this System at the configured typeclasses. Only rows
+        whose stored path differs are touched, with one UPDATE per table, and only instances
+        already in the idmapper cache are re-classed. Everything else loads with the right
+        class whenever it is first used.
+
+        Returns:
+            touched (tuple): (categories updated, channels updated)
+        """
+        bri = self.channel_system_bridge
+        touched = list()
+        for model, rows, typeclass in (
+                (ScriptDB, ScriptDB.objects.filter(channel_category_bridge__db_system=bri),
+                 self.ndb.category_typeclass),
+                (ChannelDB, ChannelDB.objects.filter(channel_bridge__db_category__db_system=bri),
+                 self.ndb.channel_typeclass)):
+            path = f"{typeclass.__module__}.{typeclass.__name__}"
+            if (ids := list(rows.exclude(db_typeclass_path=path).values_list('id', flat=True))):
+                model.objects.filter(id__in=ids).update(db_typeclass_path=path)
+                for found_id in ids:
+                    if (cached := model.get_cached_instance(found_id)):
+                        cached.db_typeclass_path = path
+                        cached.set_class_from_typeclass(typeclass_path=path)
+            touched.append(len(ids))
+        if any(touched):
+            self.hierarchy.invalidate()
+        return tuple(touched)
 
     def create_bridge(self, sys_key, category_typeclass, channel_typeclass, command_class):
         if hasattr(self, 'channel_system_bridge'):
@@ -434,6 +910,9 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
             return user.check_lock('pperm(Admin)')
         return False
 
+    def rate_limit(self, option):
+        return self.attributes.get(option, category='channel_rate')
+
     @classmethod
     def create_channel_system(cls, name, category_typeclass, channel_typeclass, command_class):
         if '|' in name and not name.endswith('|n'):
@@ -471,7 +950,187 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
             self.at_start()
 
     def categories(self):
-        return [b.db_script for b in self.channel_system_bridge.channel_categories.all().order_by('db_name')]
+        return self.hierarchy.categories()
+
+    def resolve_targets(self, enactor, targets):
+        """
+        Resolves many targets at once, looking each Category up only once.
+
+        Args:
+            enactor (obj): Who is looking.
+            targets (list): Each is '<category>[/<channel>]', or a (category[, channel]) tuple.
+                An empty target is the System itself.
+
+        Returns:
+            found (list): The Systems, Categories and Channels, in order.
+        """
+        categories = dict()
+        found = list()
+        for target in targets:
+            if isinstance(target, str):
+                target = tuple(part.strip() for part in target.split('/', 1) if part.strip())
+            if not target:
+                found.append(self)
+                continue
+            if (category := categories.get(str(target[0]).lower(), None)) is None:
+                category = categories[str(target[0]).lower()] = self.find_category(enactor, target[0])
+            found.append(category.find_channel(enactor, target[1]) if len(target) > 1 else category)
+        return found
+
+    def create_channels(self, session, category, names):
+        """
+        Creates many Channels in one Category, in one transaction. Every name is checked before
+        anything is created.
+        """
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        category = self.find_category(enactor, category)
+        if not category.check_position(enactor, 'operator'):
+            raise ValueError("Permission denied.")
+        typeclass = self.ndb.channel_typeclass
+        prepared = list()
+        seen = set()
+        for name in names:
+            raw_key, clean_key = typeclass.clean_channel_name(category, name)
+            if clean_key.lower() in seen:
+                raise ValueError(f"{clean_key} is listed more than once!")
+            seen.add(clean_key.lower())
+            prepared.append((raw_key, clean_key))
+        if not prepared:
+            raise ValueError("No Channels to create!")
+        channels = list()
+        bridges = list()
+        try:
+            with transaction.atomic():
+                for raw_key, clean_key in prepared:
+                    channel, errors = typeclass.create(clean_key)
+                    if not channel:
+                        raise ValueError(errors)
+                    channels.append(channel)
+                    bridges.append(ChannelBridge(db_channel=channel, db_name=clean_key, db_iname=clean_key.lower(),
+                                                 db_cname=raw_key, db_category=category.channel_category_bridge))
+                ChannelBridge.objects.bulk_create(bridges)
+        except Exception:
+            # The rows are gone, but the idmapper still holds the Channels created before the
+            # failure.
+            for channel in channels:
+                channel.flush_from_cache(force=True)
+            raise
+        finally:
+            self.hierarchy.invalidate()
+        entities = {'enactor': enactor, 'target': category}
+        cmsg.BulkCreate(entities, count=len(channels),
+                        names=', '.join(clean_key for raw_key, clean_key in prepared)).send()
+        return channels
+
+    def _bulk_op(self, session, targets, operation, required, user, *args):
+        """
+        Runs a per-target operation on many targets in one transaction. Every target and the
+        enactor's position on it are checked before anything changes.
+
+        Args:
+            operation (str): Name of the HasChanOps method to call.
+            required (str): Position the enactor needs on every target.
+            user (str): The user being acted upon.
+
+        Returns:
+            result (tuple): (enactor, user, targets)
+        """
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        if not (found := self.resolve_targets(enactor, targets)):
+            raise ValueError("Nothing targeted!")
+        if not (found_user := self.find_user(session, user)):
+            raise ValueError("User not found!")
+        for target in found:
+            if not target.check_position(enactor, required):
+                raise ValueError("Permission denied.")
+        try:
+            with transaction.atomic():
+                for target in found:
+                    with target.quiet():
+                        getattr(target, operation)(session, user, *args)
+        except Exception:
+            self.discard_bulk_caches(found, found_user)
+            raise
+        return enactor, found_user, found
+
+    def discard_bulk_caches(self, targets, user):
+        """
+        Called when a bulk operation rolls back. The database is restored, but the targets
+        before the failure already updated their in-memory state, so all of it is dropped.
+        """
+        self.position_cache.invalidate()
+        self.ban_index.forget(user)
+        for target in targets:
+            if (reset := getattr(target.attributes, 'reset_cache', None)):
+                reset()
+        for target in targets:
+            target.refresh_listeners(user)
+
+    def grant_many(self, session, targets, user, position):
+        """
+        Grants a user a Position on many targets in one transaction, with one message.
+        """
+        if position.lower() not in AbstractChannel.access_hierarchy:
+            raise ValueError(f"Unknown position: {position}")
+        enactor, user, found = self._bulk_op(session, targets, 'grant', 'operator', user, position)
+        entities = {'enactor': enactor, 'user': user}
+        cmsg.BulkGrant(entities, status=position, count=len(found),
+                       names=', '.join(getattr(target, 'fullname', str(target)) for target in found)).send()
+        return found
+
+    def ban_many(self, session, targets, user, duration):
+        """
+        Bans a user from many targets in one transaction, with one message.
+        """
+        enactor, user, found = self._bulk_op(session, targets, 'ban', 'moderator', user, duration)
+        entities = {'enactor': enactor, 'user': user}
+        cmsg.BulkBan(entities, duration=duration, count=len(found),
+                     names=', '.join(getattr(target, 'fullname', str(target)) for target in found)).send()
+        return found
+
+    def move_channels(self, session, channels, destination):
+        """
+        Moves many Channels into another Category with one bulk update.
+
+        Args:
+            channels (list): '<category>/<channel>' strings or (category, channel) tuples.
+            destination (str): Name of the Category to move them to.
+        """
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        destination = self.find_category(enactor, destination)
+        if not destination.check_position(enactor, 'operator'):
+            raise ValueError("Permission denied.")
+        found = self.resolve_targets(enactor, channels)
+        if not found:
+            raise ValueError("No Channels to move!")
+        names = set()
+        for channel in found:
+            if not isinstance(channel, AbstractChannel):
+                raise ValueError(f"{channel} is not a Channel!")
+            if not channel.category.check_position(enactor, 'operator'):
+                raise ValueError("Permission denied.")
+            if (iname := channel.bridge.db_iname) in names:
+                raise ValueError(f"More than one Channel named {channel} would end up in {destination}!")
+            names.add(iname)
+            if (existing := self.hierarchy.channel_named(destination, iname)) and existing not in found:
+                raise ValueError(f"{destination} already has a Channel named {channel}!")
+        bridges = [channel.bridge for channel in found]
+        for bridge in bridges:
+            bridge.db_category = destination.channel_category_bridge
+        with transaction.atomic():
+            ChannelBridge.objects.bulk_update(bridges, ['db_category'])
+        for channel in found:
+            channel.ndb.category = destination
+        self.hierarchy.invalidate()
+        self.position_cache.invalidate()
+        for channel in found:
+            channel.refresh_listeners()
+        entities = {'enactor': enactor, 'target': destination}
+        cmsg.BulkMove(entities, count=len(found), names=', '.join(str(channel) for channel in found)).send()
+        return found
 
     def visible_categories(self, checker):
         return [cat for cat in self.categories() if cat.access(checker, 'see') or True]
@@ -481,7 +1140,7 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
             return name
         if isinstance(name, ChannelCategoryBridge):
             return name.db_script
-        if (found := partial_match(name, self.visible_categories(user))):
+        if (found := self.hierarchy.find_category(name)):
             return found
         raise ValueError(f"Cannot find Channel Category: {name}")
 
@@ -621,6 +1280,18 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
         category = self.find_category(enactor, category)
         return category.examine_channel(session, name)
 
+    def search_channel(self, session, category, name, terms):
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        category = self.find_category(enactor, category)
+        return category.search_channel(session, name, terms)
+
+    def reindex_channel(self, session, category, name):
+        if not (enactor := self.get_enactor(session)):
+            raise ValueError("Permission denied.")
+        category = self.find_category(enactor, category)
+        return category.reindex_channel(session, name)
+
     def describe_category(self, session, category, description):
         if not (enactor := self.get_enactor(session)):
             raise ValueError("Permission denied.")
@@ -634,7 +1305,10 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
         return category.describe_channel(session, name, description)
 
     def channels(self):
-        return AbstractChannel.objects.filter_family(channel_bridge__db_category__db_system__db_script=self).order_by('channel_bridge__db_category__db_name', 'db_key')
+        return self.hierarchy.channels()
+
+    def listener_channels(self):
+        return self.channels()
 
     def visible_channels(self, user):
         return [channel for channel in self.channels() if channel.check_position(user, 'listener')]
@@ -642,15 +1316,41 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
     def target_channel(self, session, category, name):
         if not (enactor := self.get_enactor(session)):
             raise ValueError("Permission denied.")
-        channel_tree = defaultdict(list)
-        for channel in self.visible_channels(enactor):
-            channel_tree[channel.category].append(channel)
-        if not (category := partial_match(category, channel_tree.keys())):
+        hierarchy = self.hierarchy
+
+        def visible(chan):
+            return chan.check_position(enactor, 'listener')
+
+        def has_visible(cat):
+            return any(visible(chan) for chan in hierarchy.channels(cat))
+
+        if not (category := hierarchy.find_category(category, has_visible)):
             raise ValueError("Category not found!")
-        if not (channel := partial_match(name, channel_tree[category])):
+        if not (channel := hierarchy.find_channel(category, name, visible)):
             raise ValueError("Channel not found!")
         return (self, category, channel)
 
+    def channel_list_data(self, enactor, channels):
+        """
+        Gathers everything render_channel_list needs in one pass. The enactor's subscriptions
+        are fetched with a single query, bans come from BanIndex.banned_map and listener counts
+        come from the listener indexes, which build_indexes() builds together if they aren't yet.
+
+        Returns:
+            rows (list): (channel, subscription or None, banned, online count, allowed count)
+        """
+        subscriptions = dict()
+        for sub in enactor.channels.subscriptions.filter(db_channel__in=channels).order_by('id'):
+            subscriptions.setdefault(sub.db_channel_id, sub)
+        banned = self.ban_index.banned_map(enactor, channels)
+        build_indexes(channels)
+        rows = list()
+        for channel in channels:
+            stats = channel.listener_stats()
+            rows.append((channel, subscriptions.get(channel.id, None), banned[channel],
+                         stats['online'], stats['allowed']))
+        return rows
+
     def render_channel_list(self, session):
         if not (enactor := self.get_enactor(session)):
             raise ValueError("Permission denied.")
@@ -661,15 +1361,10 @@ class AbstractChannelSystem(HasChanOps, AthanorOptionScript):
         message.append(styling.styled_header(f"{str(self).capitalize()} Channels"))
         message.append(styling.styled_columns("Sts Name                 Users     Description"))
         this_cat = None
-        subscriptions = enactor.channels.subscriptions.filter(db_channel__channel_bridge__db_category__db_system__db_script=self)
-        for channel in channels:
+        for channel, sub, banned, active, allowed in self.channel_list_data(enactor, channels):
             if this_cat != (this_cat := channel.category):
                 message.append(styling.styled_separator(f"{this_cat} Channels"))
-            sub = subscriptions.filter(db_channel=channel).first()
-            banned = channel.is_banned(enactor)
             status = 'Ban' if banned else sub.print_status() if sub else 'Off'
-            allowed = channel.allowed_listeners()
-            active = channel.active_listeners(allowed)
-            message.append(f"{status:<3} {channel.cname[:20]:<21}{len(active):0>3}/{len(allowed):0>3} {channel.description[:43]}")
+            message.append(f"{status:<3} {channel.cname[:20]:<21}{active:0>3}/{allowed:0>3} {channel.description[:43]}")
         message.append(styling.blank_footer)
         return "\n".join(str(l) for l in message)
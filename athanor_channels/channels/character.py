@@ -12,15 +12,21 @@ class HasCharacterUser(object):
 
 
 class CharacterChannel(HasCharacterUser, AbstractChannel):
+    namespace = 'character'
 
     def get_sender(self, sending_session=None):
         if not sending_session:
             return None
         return sending_session.get_puppet()
 
+    def render_options(self, recipient):
+        if not (account := recipient.account):
+            return None
+        return account.options
+
     @property
     def subscriptions(self):
-        return self.object_subscriptions
+        return self.character_subscriptions
 
 
 class CharacterChannelCategory(HasCharacterUser, AbstractChannelCategory):
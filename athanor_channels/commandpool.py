@@ -0,0 +1,36 @@
+from weakref import WeakValueDictionary
+
+
+class ChannelCommandPool(object):
+    """
+    Interns alias Commands for a Channel System. Everyone who uses the same alias for the same
+    Channel shares one Command instance; the subscription is looked up from the caller when the
+    Command runs.
+    """
+
+    def __init__(self, command_class):
+        self.command_class = command_class
+        # (channel id, alias) -> Command. Entries vanish when no cmdset uses them anymore.
+        self.commands = WeakValueDictionary()
+
+    def command_locks(self, channel):
+        return "cmd:all();%s" % channel.locks
+
+    def get(self, channel, alias):
+        key = (channel.id, alias.lower())
+        if (cmd := self.commands.get(key, None)) is None:
+            cmd = self.command_class(key=alias, locks=self.command_locks(channel), channel_id=channel.id)
+            self.commands[key] = cmd
+        return cmd
+
+    def refresh_locks(self, channel):
+        """
+        Patches the locks of pooled commands in place after a Channel's locks were changed.
+        """
+        locks = self.command_locks(channel)
+        for (channel_id, alias), cmd in list(self.commands.items()):
+            if channel_id != channel.id:
+                continue
+            cmd.locks = locks
+            cmd.lock_storage = locks
+            cmd.lockhandler.reset()
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 from athanor.commands.command import AthanorCommand
 from athanor.utils.text import Speech
@@ -70,24 +71,47 @@ Usage:
     {key}/codename <code name>
         An alternate name you will appear as, on supported channels.
 
+    {key}/last [<number>]
+        Replay the last <number> messages (default 10) said on the channel.
+
+    {key}/catchup
+        Toggle being shown the messages you missed whenever you log in.
+
+    {key}/digest
+        Toggle receiving a periodic summary of the channel instead of
+        every message. Use /last to read what the summary counted.
+
     Set /title, /altname, or /codename to None to clear them.
 """
 
 
+@lru_cache(maxsize=1024)
+def _channel_doc(key, system_key):
+    return _CHANNEL_DOC.format(key=key, system_key=system_key)
+
+
 class AbstractChannelCommand(HasChannelSystem, AthanorCommand):
-    switch_options = ('who', 'leave', 'title', 'altname', 'mute', 'unmute', 'codename', 'on', 'off')
+    switch_options = ('who', 'leave', 'title', 'altname', 'mute', 'unmute', 'codename', 'on', 'off', 'last',
+                      'catchup', 'digest')
     controller_key = 'channel'
     user_controller = None
+    default_last = 10
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.__doc__ = _CHANNEL_DOC.format(key=self.key, system_key=self.system_key)
+    @property
+    def subscription(self):
+        return self.caller.channels.get_alias(self.key)
+
+    def get_help(self, caller, cmdset):
+        return _channel_doc(self.key, self.system_key)
 
     def switch_main(self):
         subscrip = self.subscription
         channel = subscrip.db_channel
         if not channel.is_position(self.caller, 'speaker'):
             raise ValueError("Permission denied.")
+        if channel.is_banned_anywhere(self.caller):
+            raise ValueError("You are banned from this channel.")
+        channel.check_rate(self.caller)
         alternate_name = None
         if subscrip.db_ccodename:
             alternate_name = subscrip.db_ccodename
@@ -96,7 +120,7 @@ class AbstractChannelCommand(HasChannelSystem, AthanorCommand):
         channel.broadcast(speech_obj, self.session)
 
     def switch_leave(self):
-        self.caller.channels.remove(self.subscription)
+        self.caller.channels.leave(self.subscription)
 
     def switch_codename(self):
         self.caller.channels.codename(self.subscription, self.args)
@@ -119,9 +143,23 @@ class AbstractChannelCommand(HasChannelSystem, AthanorCommand):
     def switch_off(self):
         self.caller.channels.off(self.subscription)
 
+    def switch_catchup(self):
+        self.caller.channels.catchup(self.subscription)
+
+    def switch_digest(self):
+        self.caller.channels.digest(self.subscription)
+
     def switch_who(self):
         self.caller.channels.who(self.subscription)
 
+    def switch_last(self):
+        count = self.default_last
+        if self.args:
+            if not self.args.isdigit() or not (count := int(self.args)):
+                raise ValueError("Must provide a positive number of messages!")
+        channel = self.subscription.db_channel
+        self.msg(channel.render_history(self.caller, count, self.user_controller))
+
 
 _ADMIN_DOC = """
 This command is for administrating the {system_key} Channel System.
@@ -161,6 +199,22 @@ Usage:
         Banning from System/Category cascades to Categories/Channels.
         Use {key}/unban <target>=<user> to rescind a ban early.
 
+    {key}/config <target>=<option>,<value>
+        Changes a configuration option. Flood control options are
+        speaker_rate (per person) and channel_rate (everyone together),
+        set as <messages>:<seconds> such as 5:10, or 0 to clear.
+        Channels inherit these from their Category, and Categories
+        from the System. Moderators and Operators are exempt.
+
+    {key}/search <category>/<channel>=<terms>
+        Search a channel's history. All words must appear. Use "quotes"
+        for exact phrases, speaker:<name> to filter by speaker or codename,
+        and page:<number> to see further results. Requires Moderator.
+
+    {key}/reindex <category>/<channel>
+        Rebuild a channel's search index from its history logs.
+        Requires Operator.
+
 Hierarchy: 
     The Channel System is arranged as System -> Category -> Channel.
 
@@ -181,7 +235,8 @@ _TARGET = "<category>[/<channel>]"
 
 
 class AbstractChannelAdminCommand(HasDisplayList):
-    switch_options = ('create', 'rename', 'lock', 'config', 'grant', 'revoke', 'ban', 'unban', 'describe')
+    switch_options = ('create', 'rename', 'lock', 'config', 'grant', 'revoke', 'ban', 'unban', 'describe',
+                      'search', 'reindex')
     switch_syntax = {
         'create': f"{_TARGET}[=<description]",
         'rename': f"{_TARGET}=<new name>",
@@ -191,7 +246,9 @@ class AbstractChannelAdminCommand(HasDisplayList):
         'revoke': f"{_TARGET}=<user>,<position>",
         'ban': f"{_TARGET}=<user>,<duration>",
         'unban': f"{_TARGET}=<user>",
-        'describe': f"{_TARGET}=<new description>"
+        'describe': f"{_TARGET}=<new description>",
+        'search': "<category>/<channel>=<terms>",
+        'reindex': "<category>/<channel>"
     }
     lhs_delim = '/'
 
@@ -265,6 +322,18 @@ class AbstractChannelAdminCommand(HasDisplayList):
     def switch_config(self):
         return self._switch_multi('config', 2)
 
+    def switch_search(self):
+        target = self.target_channel(self.lhslist)
+        if len(target) != 3 or not self.rhs:
+            self.syntax_error()
+        self.msg(self.controller.search_channel(self.session, *target, self.rhs))
+
+    def switch_reindex(self):
+        target = self.target_channel(self.lhslist)
+        if len(target) != 3:
+            self.syntax_error()
+        self.msg(self.controller.reindex_channel(self.session, *target))
+
 
 _USE_COMMAND = """
 Command used to manage subscriptions to {system_key} channels.
@@ -1,10 +1,17 @@
+import time
+
 from django.conf import settings
+from twisted.internet import reactor
 
-from evennia.utils.utils import class_from_module
+from evennia.utils.utils import class_from_module, lazy_property
+from evennia.utils.logger import log_info
 
 from athanor.controllers.base import AthanorController
 from athanor_channels.models import ChannelSystemBridge
 from athanor_channels.channels.base import AbstractChannelSystem
+from athanor_channels.delivery import DELIVERY_QUEUE
+from athanor_channels.snapshot import CHANNEL_SNAPSHOT
+from athanor_channels.permissions import connect_signals
 
 
 class AthanorChannelController(AthanorController):
@@ -14,7 +21,11 @@ class AthanorChannelController(AthanorController):
         """
         This loads the fallbacks for when more specific settings are not defined in settings.py.
         """
-
+        started = time.time()
+        connect_signals()
+        CHANNEL_SNAPSHOT.load()
+        reactor.addSystemEventTrigger('before', 'shutdown', CHANNEL_SNAPSHOT.save)
+        categories = channels = 0
         for sys_key, sys_data in settings.CHANNEL_SYSTEMS.items():
             sys_typeclass = sys_data.get("system_typeclass")
             cat_typeclass = sys_data.get("category_typeclass")
@@ -25,25 +36,72 @@ class AthanorChannelController(AthanorController):
                 found.integrity_check(sys_typeclass, cat_typeclass, chan_typeclass, command_class)
                 found.at_start()
             except ValueError as e:
-                self.create_system(sys_key, sys_typeclass, cat_typeclass, chan_typeclass, command_class)
+                found = self.create_system(sys_key, sys_typeclass, cat_typeclass, chan_typeclass, command_class)
+            if (touched := found.ndb.reconciled):
+                categories += touched[0]
+                channels += touched[1]
+        for bridge in ChannelSystemBridge.objects.select_related('db_script'):
+            self.register_system(bridge.db_script)
+        log_info(f"Channel Systems loaded in {time.time() - started:.3f}s: {len(settings.CHANNEL_SYSTEMS)} systems, "
+                 f"{categories} categories and {channels} channels re-typeclassed.")
+
+    @lazy_property
+    def system_registry(self):
+        """
+        System key -> Channel System script. Filled by do_load and create_system so that
+        resolving a System on the command path doesn't query.
+        """
+        return dict()
+
+    def register_system(self, system):
+        self.system_registry[system.channel_system_bridge.db_system_key] = system
 
     def systems(self):
-        return [bridge.db_script for bridge in ChannelSystemBridge.objects.all()]
+        return [system for system in self.system_registry.values() if system.pk]
 
     def create_system(self, sys_key, system_typeclass, category_typeclass, channel_typeclass, command_class):
         sys_typeclass = class_from_module(system_typeclass)
         new_system = sys_typeclass.create_channel_system(sys_key, category_typeclass, channel_typeclass, command_class)
+        self.register_system(new_system)
         return new_system
 
+    def delivery_stats(self):
+        """
+        Queue depth and broadcast latency for Channel delivery.
+        """
+        return DELIVERY_QUEUE.stats()
+
     def find_system(self, sys_key):
         if isinstance(sys_key, ChannelSystemBridge):
             return sys_key.db_script
         if isinstance(sys_key, AbstractChannelSystem):
             return sys_key
+        if (found := self.system_registry.get(sys_key, None)) is not None:
+            # A deleted script has no pk. Drop it and fall back to the database.
+            if found.pk:
+                return found
+            del self.system_registry[sys_key]
         if (chan_sys := ChannelSystemBridge.objects.filter(db_system_key=sys_key).first()):
+            self.register_system(chan_sys.db_script)
             return chan_sys.db_script
         raise ValueError(f"Channel System {sys_key} does not exist!")
 
+    def create_channels(self, session, sys_key, category, names):
+        chan_sys = self.find_system(sys_key)
+        return chan_sys.create_channels(session, category, names)
+
+    def grant_many(self, session, sys_key, targets, user, position):
+        chan_sys = self.find_system(sys_key)
+        return chan_sys.grant_many(session, targets, user, position)
+
+    def ban_many(self, session, sys_key, targets, user, duration):
+        chan_sys = self.find_system(sys_key)
+        return chan_sys.ban_many(session, targets, user, duration)
+
+    def move_channels(self, session, sys_key, channels, destination):
+        chan_sys = self.find_system(sys_key)
+        return chan_sys.move_channels(session, channels, destination)
+
     def create_category(self, session, sys_key, name):
         chan_sys = self.find_system(sys_key)
         return chan_sys.create_category(session, name)
@@ -152,6 +210,14 @@ class AthanorChannelController(AthanorController):
         chan_sys = self.find_system(sys_key)
         return chan_sys.examine_channel(session, category, name)
 
+    def search_channel(self, session, sys_key, category, name, terms):
+        chan_sys = self.find_system(sys_key)
+        return chan_sys.search_channel(session, category, name, terms)
+
+    def reindex_channel(self, session, sys_key, category, name):
+        chan_sys = self.find_system(sys_key)
+        return chan_sys.reindex_channel(session, category, name)
+
     def target_channel(self, session, sys_key, category, name):
         chan_sys = self.find_system(sys_key)
         return chan_sys.target_channel(session, category, name)
@@ -0,0 +1,278 @@
+import time
+from collections import deque, Counter
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+from twisted.internet import reactor
+
+from evennia.utils.logger import log_trace
+
+
+class DeliveryJob(object):
+    """
+    One broadcast waiting to reach its recipients. Renders are shared between recipients with
+    the same render key, as before.
+    """
+
+    def __init__(self, channel, text, sender, recipients):
+        self.channel = channel
+        self.text = text
+        self.sender = sender
+        self.recipients = deque(recipients)
+        self.rendered = dict()
+        self.hits = 0
+        self.enqueued = time.time()
+
+    def step(self, queue):
+        subscription = self.recipients.popleft()
+        owner = subscription.owner
+        key = self.channel.render_key(owner, self.sender, subscription)
+        if (message := self.rendered.get(key, None)) is None:
+            message = self.rendered[key] = self.channel.render_message(self.text, owner, self.sender, subscription)
+        else:
+            self.hits += 1
+        queue.deliver(self.channel, owner, message)
+
+    def finish(self):
+        stats = self.channel.stats
+        stats['broadcasts'] += 1
+        stats['render_variants'] += len(self.rendered)
+        stats['render_hits'] += self.hits
+        self.channel.ndb.last_render = (len(self.rendered), self.hits)
+
+
+class DeliveryQueue(object):
+    """
+    Fans Channel broadcasts out to recipients from the reactor instead of the speaker's command.
+
+    Jobs are drained oldest first in time slices: after every CHANNEL_DELIVERY_CHUNK recipients
+    the slice checks its clock, and once CHANNEL_DELIVERY_SLICE seconds are used it hands control
+    back to the reactor so other commands get a turn before delivery resumes.
+    """
+
+    def __init__(self):
+        self.jobs = deque()
+        self.pending = 0
+        self.delivered = 0
+        self.completed = 0
+        self.latencies = deque(maxlen=100)
+        self._call = None
+
+    def enqueue(self, channel, text, sender, recipients):
+        if not (recipients := list(recipients)):
+            DeliveryJob(channel, text, sender, recipients).finish()
+            return
+        self.jobs.append(DeliveryJob(channel, text, sender, recipients))
+        self.pending += len(recipients)
+        self.schedule()
+
+    def schedule(self):
+        if self.jobs and not (self._call and self._call.active()):
+            self._call = reactor.callLater(0, self.drain)
+
+    def deliver(self, channel, owner, message):
+        if settings.CHANNEL_COALESCE_WINDOW or settings.CHANNEL_SESSION_BUDGET:
+            COALESCER.add(channel, owner, message)
+        else:
+            owner.msg(message)
+
+    def drain(self):
+        self._call = None
+        chunk = settings.CHANNEL_DELIVERY_CHUNK
+        deadline = time.time() + settings.CHANNEL_DELIVERY_SLICE
+        sent = 0
+        while self.jobs:
+            job = self.jobs[0]
+            if job.recipients:
+                try:
+                    job.step(self)
+                except Exception:
+                    log_trace()
+                self.pending -= 1
+                self.delivered += 1
+                sent += 1
+            if not job.recipients:
+                self.jobs.popleft()
+                job.finish()
+                self.completed += 1
+                self.latencies.append(time.time() - job.enqueued)
+            if not sent % chunk and time.time() >= deadline:
+                break
+        self.schedule()
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): Queue depth in messages and recipients, totals, and end-to-end latency
+                (seconds from broadcast to last recipient) over recent messages.
+        """
+        latencies = self.latencies
+        return {'depth': len(self.jobs), 'pending': self.pending, 'delivered': self.delivered,
+                'completed': self.completed,
+                'latency_avg': (sum(latencies) / len(latencies)) if latencies else 0.0,
+                'latency_max': max(latencies) if latencies else 0.0,
+                'coalescing': COALESCER.stats()}
+
+
+class SessionBuffer(object):
+    """
+    Channel output waiting for one session.
+    """
+
+    def __init__(self, owner, deadline):
+        self.owner = owner
+        self.lines = deque()
+        self.deadline = deadline
+        self.timer = None
+
+    def render(self):
+        return "\n".join(str(line) for channel, line in self.lines)
+
+
+class SessionLoad(object):
+    """
+    Estimated Channel output still pending for one session. The server can't see the portal's
+    or the client's buffers, so every line sent adds one and the total drains at
+    CHANNEL_SESSION_DRAIN_RATE lines per second. This carries over between flushes.
+    """
+
+    def __init__(self, owner, now):
+        self.owner = owner
+        self.level = 0.0
+        self.stamp = now
+        self.degraded = False
+        self.skipped = Counter()
+        self.held = deque(maxlen=settings.CHANNEL_DEGRADED_KEEP)
+        self.timer = None
+
+    def drain(self, now):
+        self.level = max(self.level - (now - self.stamp) * settings.CHANNEL_SESSION_DRAIN_RATE, 0.0)
+        self.stamp = now
+        return self.level
+
+    def render(self):
+        lines = [str(line) for channel, line in self.held]
+        for name, count in self.skipped.items():
+            lines.append(f"{count} message{'s' if count != 1 else ''} skipped on {name}.")
+        return "\n".join(lines)
+
+
+class OutputCoalescer(object):
+    """
+    Merges Channel lines bound for the same session into one send, and keeps slow sessions from
+    piling up unbounded output.
+
+    A session's buffer is flushed once it has been idle for CHANNEL_COALESCE_WINDOW seconds, or
+    CHANNEL_COALESCE_MAX_DELAY seconds after its first line, whichever comes first, so a busy
+    session still gets regular output.
+
+    If a session's estimated pending output (see SessionLoad) reaches CHANNEL_SESSION_BUDGET
+    lines, it is degraded until that drains to half the budget. Per CHANNEL_BUDGET_POLICY,
+    either the newest CHANNEL_DEGRADED_KEEP lines are held for it ('drop_oldest') or nothing is
+    ('summarize'). On recovery it gets what was held, then "N messages skipped on <channel>".
+    """
+
+    def __init__(self):
+        # session -> SessionBuffer
+        self.buffers = dict()
+        # session -> SessionLoad
+        self.loads = WeakKeyDictionary()
+        self.lines = 0
+        self.sends = 0
+        self.degraded = 0
+        self.skipped = 0
+
+    def add(self, channel, owner, message):
+        if not (sessions := owner.sessions.all()):
+            return
+        now = time.time()
+        window = settings.CHANNEL_COALESCE_WINDOW
+        budget = settings.CHANNEL_SESSION_BUDGET
+        for session in sessions:
+            self.lines += 1
+            if budget:
+                if (load := self.loads.get(session, None)) is None:
+                    load = self.loads[session] = SessionLoad(owner, now)
+                if load.degraded or load.drain(now) >= budget:
+                    self.hold(session, load, channel, message)
+                    continue
+                load.level += 1
+            if not window:
+                self.send(owner, message, session)
+                continue
+            if (buffer := self.buffers.get(session, None)) is None:
+                buffer = self.buffers[session] = SessionBuffer(owner, now + settings.CHANNEL_COALESCE_MAX_DELAY)
+            buffer.lines.append((channel, message))
+            delay = max(min(window, buffer.deadline - now), 0)
+            if buffer.timer and buffer.timer.active():
+                buffer.timer.reset(delay)
+            else:
+                buffer.timer = reactor.callLater(delay, self.flush, session)
+
+    def send(self, owner, text, session):
+        self.sends += 1
+        try:
+            owner.msg(text, session=session)
+        except Exception:
+            log_trace()
+
+    def hold(self, session, load, channel, message):
+        if not load.degraded:
+            load.degraded = True
+            self.degraded += 1
+            self.schedule_recovery(session, load)
+        if settings.CHANNEL_BUDGET_POLICY == 'drop_oldest' and load.held.maxlen:
+            if len(load.held) == load.held.maxlen:
+                self.skip(load, load.held[0][0])
+            load.held.append((channel, message))
+        else:
+            self.skip(load, channel)
+
+    def skip(self, load, channel):
+        load.skipped[channel.fullname] += 1
+        channel.stats['skipped'] += 1
+        self.skipped += 1
+
+    def schedule_recovery(self, session, load):
+        target = settings.CHANNEL_SESSION_BUDGET // 2
+        delay = max(load.level - target, 0) / settings.CHANNEL_SESSION_DRAIN_RATE
+        load.timer = reactor.callLater(delay, self.recover, session)
+
+    def recover(self, session):
+        if (load := self.loads.get(session, None)) is None:
+            return
+        load.timer = None
+        if load.drain(time.time()) > settings.CHANNEL_SESSION_BUDGET // 2:
+            self.schedule_recovery(session, load)
+            return
+        text = load.render()
+        load.level += len(load.held) + len(load.skipped)
+        load.degraded = False
+        load.held.clear()
+        load.skipped.clear()
+        if text:
+            self.send(load.owner, text, session)
+
+    def flush(self, session):
+        if (buffer := self.buffers.pop(session, None)) is None:
+            return
+        if buffer.timer and buffer.timer.active():
+            buffer.timer.cancel()
+        self.send(buffer.owner, buffer.render(), session)
+
+    def flush_all(self):
+        for session in list(self.buffers.keys()):
+            self.flush(session)
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): Lines buffered, sends actually made, sessions currently waiting, how
+                often a session was degraded and how many lines that skipped.
+        """
+        return {'lines': self.lines, 'sends': self.sends, 'saved': self.lines - self.sends,
+                'buffered': len(self.buffers), 'degraded': self.degraded, 'skipped': self.skipped}
+
+
+DELIVERY_QUEUE = DeliveryQueue()
+COALESCER = OutputCoalescer()
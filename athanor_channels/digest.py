@@ -0,0 +1,45 @@
+from weakref import WeakSet
+
+from django.conf import settings
+from twisted.internet.task import LoopingCall
+
+from evennia.utils.logger import log_trace
+
+
+class DigestScheduler(object):
+    """
+    Sends periodic summaries to subscriptions in digest mode, instead of every line.
+
+    Channels register themselves once they have a digest listener. Every
+    CHANNEL_DIGEST_INTERVAL seconds, each online digest listener is told how many messages were
+    said since their last digest. Message ids are sequential, so this is a subtraction per
+    listener and never walks the history.
+    """
+
+    def __init__(self):
+        self.channels = WeakSet()
+        self.task = None
+        self.sent = 0
+
+    def start(self):
+        if self.task:
+            return
+        self.task = LoopingCall(self.run)
+        self.task.start(settings.CHANNEL_DIGEST_INTERVAL, now=False)
+
+    def register(self, channel):
+        self.channels.add(channel)
+        self.start()
+
+    def run(self):
+        for channel in list(self.channels):
+            if not channel.listener_index.digesting:
+                self.channels.discard(channel)
+                continue
+            try:
+                self.sent += channel.send_digests()
+            except Exception:
+                log_trace()
+
+
+DIGEST_SCHEDULER = DigestScheduler()
@@ -0,0 +1,104 @@
+from evennia.utils.ansi import ANSIString
+
+from athanor_channels.models import ChannelBridge
+from athanor_channels.prefix import PrefixIndex
+from athanor_channels.permissions import identity
+
+
+class ChannelHierarchy(object):
+    """
+    In-memory map of a Channel System's Categories and Channels, in display order.
+
+    It is built on first use and thrown away whenever a Category or Channel in the System is
+    created, renamed or deleted, so navigation and listings never have to query.
+    """
+
+    def __init__(self, system):
+        self.system = system
+        self.built = False
+        self._categories = list()
+        # category -> list of channels, sorted by name.
+        self._channels = dict()
+        # identity(entity) -> fullname string. Categories are Scripts and Channels are not, so
+        # keying on the table and pk keeps their pks apart.
+        self._fullnames = dict()
+        # name index of categories, and category -> name index of its channels.
+        self._category_names = PrefixIndex()
+        self._channel_names = dict()
+
+    def build(self):
+        system_bridge = self.system.channel_system_bridge
+        self._categories = list()
+        self._channels = dict()
+        self._fullnames = dict()
+        self._category_names = PrefixIndex()
+        self._channel_names = dict()
+        by_id = dict()
+        cnames = dict()
+
+        for bridge in system_bridge.channel_categories.select_related('db_script').order_by('db_name'):
+            category = bridge.db_script
+            category.ndb.system = self.system
+            by_id[bridge.pk] = category
+            cnames[category] = ANSIString(bridge.db_cname)
+            self._categories.append(category)
+            self._channels[category] = list()
+            self._channel_names[category] = PrefixIndex()
+            self._category_names.add(bridge.db_iname, category)
+            self._fullnames[identity(category)] = f"{self.system}/{bridge.db_cname}"
+
+        bridges = ChannelBridge.objects.filter(db_category__db_system=system_bridge).select_related('db_channel')
+        for bridge in bridges.order_by('db_category__db_name', 'db_channel__db_key'):
+            if not (category := by_id.get(bridge.db_category_id, None)):
+                continue
+            channel = bridge.db_channel
+            channel.ndb.category = category
+            self._channels[category].append(channel)
+            self._channel_names[category].add(bridge.db_iname, channel)
+            self._fullnames[identity(channel)] = f"{self.system}/{cnames[category]}/{ANSIString(bridge.db_cname)}"
+
+        self.built = True
+
+    def ensure(self):
+        if not self.built:
+            self.build()
+
+    def invalidate(self):
+        self.built = False
+
+    def categories(self):
+        self.ensure()
+        return list(self._categories)
+
+    def channels(self, category=None):
+        self.ensure()
+        if category is None:
+            return [channel for category in self._categories for channel in self._channels[category]]
+        return list(self._channels.get(category, ()))
+
+    def fullname(self, entity):
+        self.ensure()
+        return self._fullnames.get(identity(entity), None)
+
+    def category_named(self, name):
+        self.ensure()
+        return self._category_names.get(name)
+
+    def channel_named(self, category, name):
+        self.ensure()
+        if not (index := self._channel_names.get(category, None)):
+            return None
+        return index.get(name)
+
+    def find_category(self, name, check=None):
+        """
+        Exact-then-prefix resolution of a Category name. check can filter out candidates.
+        """
+        self.ensure()
+        return self._category_names.find(name, check)
+
+    def find_channel(self, category, name, check=None):
+        self.ensure()
+        if not (index := self._channel_names.get(category, None)):
+            return None
+        return index.find(name, check)
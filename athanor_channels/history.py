@@ -0,0 +1,209 @@
+import os
+import time
+from collections import deque
+from weakref import WeakSet
+
+from django.conf import settings
+from twisted.internet import reactor, threads
+from twisted.internet.defer import DeferredList
+from twisted.internet.task import LoopingCall
+
+from evennia.utils.logger import log_trace, log_err
+
+from athanor_channels.segmentlog import SegmentedLog
+from athanor_channels.search import ChannelSearchIndex
+
+
+class ChannelHistory(object):
+    """
+    Scrollback for one Channel.
+
+    The most recent messages live in a fixed-size ring buffer. New messages are also queued
+    and appended to the Channel's SegmentedLog in batches by the HistoryWriter, so history
+    survives reloads without a write per line. Anything older than the ring buffer is paged
+    in from the log.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.buffer = deque(maxlen=settings.CHANNEL_HISTORY_SIZE)
+        self.pending = list()
+        self.last_id = 0
+        self.loaded = False
+        self.log = SegmentedLog(os.path.join(settings.CHANNEL_HISTORY_DIR, str(channel.id)),
+                                settings.CHANNEL_LOG_SEGMENT_SIZE, settings.CHANNEL_LOG_SEGMENT_AGE,
+                                settings.CHANNEL_LOG_INDEX_INTERVAL)
+        self.search = ChannelSearchIndex(self)
+
+    def load(self):
+        self.buffer.extend(self.log.tail(self.buffer.maxlen))
+        self.last_id = self.log.last_id
+        self.loaded = True
+
+    def ensure(self):
+        if not self.loaded:
+            self.load()
+
+    def append(self, speaker, codename, title, text):
+        self.ensure()
+        self.last_id += 1
+        entry = {'id': self.last_id, 'time': time.time(), 'speaker': str(speaker) if speaker else None,
+                 'speaker_id': speaker.id if speaker else None, 'codename': codename, 'title': title,
+                 'text': text}
+        self.buffer.append(entry)
+        self.pending.append(entry)
+        HISTORY_WRITER.mark(self)
+        return entry
+
+    def latest_id(self):
+        self.ensure()
+        return self.last_id
+
+    def last(self, count):
+        self.ensure()
+        if count <= 0:
+            return list()
+        if count <= len(self.buffer) or not self.buffer:
+            return list(self.buffer)[-count:]
+        older = self.log.page(self.buffer[0]['id'], count - len(self.buffer))
+        return older + list(self.buffer)
+
+    def page(self, before=None, count=50):
+        """
+        Returns up to count messages older than the message id before, or the newest ones.
+        """
+        self.ensure()
+        if before is None:
+            return self.last(count)
+        if self.buffer and before > self.buffer[0]['id']:
+            newer = [entry for entry in self.buffer if entry['id'] < before][-count:]
+            if len(newer) < count and newer[0]['id'] > 1:
+                return self.log.page(newer[0]['id'], count - len(newer)) + newer
+            return newer
+        return self.log.page(before, count)
+
+    def get(self, message_id):
+        self.ensure()
+        if self.buffer and message_id >= self.buffer[0]['id']:
+            if (pos := message_id - self.buffer[0]['id']) < len(self.buffer):
+                return self.buffer[pos]
+            return None
+        for entry in self.log.iter_from(message_id):
+            return entry if entry['id'] == message_id else None
+        return None
+
+    def iter_from(self, message_id):
+        return self.log.iter_from(message_id)
+
+    def iter_range(self, start=None, end=None):
+        return self.log.iter_range(start, end)
+
+    def take_pending(self):
+        pending, self.pending = self.pending, list()
+        return pending
+
+    def write(self, entries):
+        """
+        Appends entries to the log. Runs in a thread.
+        """
+        self.log.append(entries)
+
+
+class HistoryWriter(object):
+    """
+    Flushes pending Channel history to disk on a timer, one batched write per dirty Channel.
+
+    A Channel has at most one write in flight. Anything said while it runs stays pending until
+    the next flush, so batches reach the log, and the search index, in id order.
+    """
+
+    def __init__(self):
+        self.dirty = set()
+        self.histories = WeakSet()
+        # history -> Deferred of its write in flight.
+        self.writing = dict()
+        # Deferreds of search index saves in flight.
+        self.saving = set()
+        self.stopping = False
+        self.task = None
+        self.save_task = None
+
+    def start(self):
+        if self.task:
+            return
+        self.task = LoopingCall(self.flush)
+        self.task.start(settings.CHANNEL_HISTORY_FLUSH_INTERVAL, now=False)
+        self.save_task = LoopingCall(self.save_indexes)
+        self.save_task.start(settings.CHANNEL_SEARCH_SAVE_INTERVAL, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.flush_now)
+
+    def mark(self, history):
+        self.dirty.add(history)
+        self.histories.add(history)
+        self.start()
+
+    def _written(self, result, history, entries):
+        history.search.feed(entries)
+
+    def _done(self, result, history):
+        self.writing.pop(history, None)
+        if history.pending:
+            self.dirty.add(history)
+        return result
+
+    def flush(self):
+        if self.stopping:
+            return
+        dirty, self.dirty = self.dirty, set()
+        deferreds = list()
+        for history in dirty:
+            if history in self.writing:
+                # Picked up by the next flush once the running write is done.
+                self.dirty.add(history)
+                continue
+            if not (entries := history.take_pending()):
+                continue
+            d = threads.deferToThread(history.write, entries)
+            d.addCallbacks(self._written, lambda failure: log_err(f"Channel history write failed: {failure}"),
+                           callbackArgs=(history, entries))
+            d.addBoth(self._done, history)
+            self.writing[history] = d
+            deferreds.append(d)
+        return DeferredList(deferreds)
+
+    def save_indexes(self):
+        for history in list(self.histories):
+            try:
+                if (d := history.search.save_later()) is not None:
+                    self.saving.add(d)
+                    d.addBoth(lambda result, d=d: self.saving.discard(d))
+            except Exception:
+                log_trace()
+
+    def flush_now(self):
+        """
+        Shutdown trigger. Waits for writes and saves already running in threads, then writes
+        everything left from the reactor thread.
+        """
+        self.stopping = True
+        if (running := list(self.writing.values()) + list(self.saving)):
+            return DeferredList(running).addCallback(lambda result: self._flush_sync())
+        self._flush_sync()
+
+    def _flush_sync(self):
+        dirty, self.dirty = self.dirty, set()
+        for history in dirty:
+            if (entries := history.take_pending()):
+                try:
+                    history.write(entries)
+                    history.search.feed(entries)
+                except Exception:
+                    log_trace()
+        for history in self.histories:
+            try:
+                history.search.save()
+            except Exception:
+                log_trace()
+
+
+HISTORY_WRITER = HistoryWriter()
@@ -0,0 +1,240 @@
+from collections import defaultdict
+
+from athanor_channels.digest import DIGEST_SCHEDULER
+from athanor_channels.snapshot import CHANNEL_SNAPSHOT
+from athanor_channels.permissions import track_index
+
+
+def build_indexes(channels):
+    """
+    Builds the listener indexes of many Channels at once, fetching the subscriptions of all the
+    unbuilt ones with one query per subscription model instead of one per Channel.
+    """
+    cold = defaultdict(list)
+    for channel in channels:
+        if not channel.listener_index.built:
+            cold[channel.subscriptions.model].append(channel)
+    for model, unbuilt in cold.items():
+        fetched = defaultdict(list)
+        for sub in model.objects.filter(db_channel__in=unbuilt).select_related(model.owner_field):
+            fetched[sub.db_channel_id].append(sub)
+        for channel in unbuilt:
+            channel.listener_index.build(fetched[channel.id])
+
+
+class ChannelListenerIndex(object):
+    """
+    In-memory index of who is listening to a Channel.
+
+    It is built from the database the first time it is needed and afterwards kept up to date by
+    the ChannelHandlers, the Ops methods (grant/revoke/ban/unban/lock) and the session hooks
+    of Accounts and Characters. Broadcasting only ever iterates over the online owners.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.built = False
+        # owner -> set of all of their subscriptions to this channel.
+        self.subscriptions = defaultdict(set)
+        # owner -> result of check_position(owner, 'listener')
+        self.positions = dict()
+        # owner -> frozenset of un-muted, enabled subscriptions. Only owners with permission.
+        self.listening = dict()
+        # owner -> the one listening subscription a broadcast is rendered and delivered through.
+        self.preferred = dict()
+        # owner -> subscription receiving digests, for owners with no live subscription.
+        self.digesting = dict()
+        # owners whose position came from a snapshot and is re-checked when they connect.
+        self.provisional = set()
+        # owners that currently have sessions.
+        self.online = set()
+        # owners that are both listening and online. Kept in step so it can be counted for free.
+        self.active = set()
+        track_index(self)
+
+    def build(self, fetched=None):
+        """
+        Args:
+            fetched (list): This Channel's subscriptions, already fetched by build_indexes().
+        """
+        if (restored := CHANNEL_SNAPSHOT.take(self.channel)) is not None:
+            subscriptions, known = restored
+        elif fetched is not None:
+            subscriptions, known = fetched, dict()
+        else:
+            subscriptions = self.channel.subscriptions
+            subscriptions = subscriptions.select_related(subscriptions.model.owner_field)
+            known = dict()
+        self.subscriptions = defaultdict(set)
+        self.positions = dict()
+        self.listening = dict()
+        self.preferred = dict()
+        self.digesting = dict()
+        self.provisional = set()
+        self.online = set()
+        self.active = set()
+        for sub in subscriptions:
+            self.subscriptions[sub.owner].add(sub)
+        self.built = True
+        CHANNEL_SNAPSHOT.track(self)
+        for owner in self.subscriptions.keys():
+            if owner.sessions.count():
+                self.online.add(owner)
+            elif (position := known.get(owner.pk, None)) is not None:
+                self.positions[owner] = position
+                self.provisional.add(owner)
+                self._evaluate(owner, position=False)
+                continue
+            self._evaluate(owner)
+
+    def ensure(self):
+        if not self.built:
+            self.build()
+
+    def _evaluate(self, owner, position=True):
+        if not (subs := self.subscriptions.get(owner, None)):
+            self.subscriptions.pop(owner, None)
+            self.positions.pop(owner, None)
+            self.provisional.discard(owner)
+            self.listening.pop(owner, None)
+            self.preferred.pop(owner, None)
+            self.digesting.pop(owner, None)
+            self.online.discard(owner)
+            self.active.discard(owner)
+            return
+        if position or owner not in self.positions:
+            self.positions[owner] = bool(self.channel.check_position(owner, 'listener'))
+            self.provisional.discard(owner)
+        enabled = [sub for sub in subs if not sub.db_muted and sub.db_enabled]
+        active = frozenset(sub for sub in enabled if not sub.db_digest)
+        if self.positions[owner] and active:
+            self.listening[owner] = active
+            self.preferred[owner] = self.choose_preferred(active)
+        else:
+            self.listening.pop(owner, None)
+            self.preferred.pop(owner, None)
+        if self.positions[owner] and enabled and not active:
+            self.digesting[owner] = self.choose_preferred(enabled)
+            DIGEST_SCHEDULER.register(self.channel)
+        else:
+            self.digesting.pop(owner, None)
+        self._sync(owner)
+
+    def choose_preferred(self, subscriptions):
+        """
+        Picks which of an owner's aliases a message is rendered for: one with an altname set if
+        any, otherwise the oldest.
+        """
+        return min(subscriptions, key=lambda sub: (not sub.db_altname, sub.id))
+
+    def _sync(self, owner):
+        if owner in self.listening and owner in self.online:
+            self.active.add(owner)
+        else:
+            self.active.discard(owner)
+
+    def add_subscription(self, subscription):
+        if not self.built:
+            # The snapshot predates this change, so this Channel must be built from the database.
+            CHANNEL_SNAPSHOT.discard(self.channel)
+            return
+        owner = subscription.owner
+        self.subscriptions[owner].add(subscription)
+        if owner.sessions.count():
+            self.online.add(owner)
+        self._evaluate(owner, position=False)
+
+    def remove_subscription(self, subscription):
+        if not self.built:
+            # The snapshot predates this change, so this Channel must be built from the database.
+            CHANNEL_SNAPSHOT.discard(self.channel)
+            return
+        owner = subscription.owner
+        if owner in self.subscriptions:
+            self.subscriptions[owner].discard(subscription)
+        self._evaluate(owner, position=False)
+
+    def clear(self):
+        """
+        Forgets every subscription, after they were all deleted at once.
+        """
+        if not self.built:
+            # The snapshot predates this change, so this Channel must be built from the database.
+            CHANNEL_SNAPSHOT.discard(self.channel)
+            return
+        for owner in list(self.subscriptions.keys()):
+            self.subscriptions[owner].clear()
+            self._evaluate(owner)
+
+    def update_subscription(self, subscription):
+        """
+        Called when a subscription's muted/enabled flags change.
+        """
+        if not self.built:
+            # The snapshot predates this change, so this Channel must be built from the database.
+            CHANNEL_SNAPSHOT.discard(self.channel)
+            return
+        self._evaluate(subscription.owner, position=False)
+
+    def refresh(self, user=None):
+        """
+        Re-evaluates listener permission for a single user, or everyone if no user is given.
+        """
+        if not self.built:
+            # The snapshot predates this change, so this Channel must be built from the database.
+            CHANNEL_SNAPSHOT.discard(self.channel)
+            return
+        if user is None:
+            for owner in list(self.subscriptions.keys()):
+                self._evaluate(owner)
+        elif user in self.subscriptions:
+            self._evaluate(user)
+
+    def refresh_matching(self, match=None):
+        """
+        Re-evaluates listener permission for every owner match accepts, or everyone. Used for
+        permission changes made outside the Channel System.
+        """
+        if not self.built:
+            return
+        for owner in [owner for owner in self.subscriptions.keys() if match is None or match(owner)]:
+            self._evaluate(owner)
+
+    def set_online(self, owner, online):
+        if not self.built or owner not in self.subscriptions:
+            return
+        if online:
+            self.online.add(owner)
+            if owner in self.provisional:
+                self._evaluate(owner)
+                return
+        else:
+            self.online.discard(owner)
+        self._sync(owner)
+
+    def owners(self):
+        self.ensure()
+        return set(self.subscriptions.keys())
+
+    def allowed_listeners(self):
+        self.ensure()
+        return {sub for subs in self.listening.values() for sub in subs}
+
+    def active_listeners(self):
+        self.ensure()
+        return {sub for owner in self.active for sub in self.listening[owner]}
+
+    def active_deliveries(self):
+        """
+        One subscription per online, listening owner, however many aliases they have.
+        """
+        self.ensure()
+        return [self.preferred[owner] for owner in self.active]
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): Number of owners allowed to listen, and how many of those are online.
+        """
+        self.ensure()
+        return {'allowed': len(self.listening), 'online': len(self.active)}
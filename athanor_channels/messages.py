@@ -80,3 +80,47 @@ class Unban(ChannelMessage):
 
 class Describe(ChannelMessage):
     pass
+
+
+class Silent(object):
+    """
+    Stands in for a message class while a bulk operation sends one summary instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def send(self):
+        pass
+
+
+class BulkCreate(ChannelMessage):
+    messages = {
+        'enactor': "Successfully created {count} Channels in {target_fullname}: {names}",
+        'target': "|w{enactor_name}|n created {count} Channels in {target_fullname}: {names}",
+        'admin': "|w{enactor_name}|n created {count} Channels in {target_fullname}: {names}"
+    }
+
+
+class BulkMove(ChannelMessage):
+    messages = {
+        'enactor': "Successfully moved {count} Channels to {target_fullname}: {names}",
+        'target': "|w{enactor_name}|n moved {count} Channels to {target_fullname}: {names}",
+        'admin': "|w{enactor_name}|n moved {count} Channels to {target_fullname}: {names}"
+    }
+
+
+class BulkGrant(ChannelMessage):
+    messages = {
+        'enactor': "Successfully granted {user_name} the {status} Status on {count} targets: {names}",
+        'user': "|w{enactor_name}|n granted you the {status} Status on {count} targets: {names}",
+        'admin': "|w{enactor_name}|n granted {user_name} the {status} Status on {count} targets: {names}"
+    }
+
+
+class BulkBan(ChannelMessage):
+    messages = {
+        'enactor': "Successfully banned {user_name} from {count} targets for {duration}: {names}",
+        'user': "|w{enactor_name}|n banned you from {count} targets for {duration}: {names}",
+        'admin': "|w{enactor_name}|n banned {user_name} from {count} targets for {duration}: {names}"
+    }
@@ -8,9 +8,26 @@ class AccountChannelMixin(object):
     def channels(self):
         return AccountChannelHandler(self)
 
+    def at_post_login(self, session=None, **kwargs):
+        super().at_post_login(session=session, **kwargs)
+        self.channels.at_connect()
+
+    def at_disconnect(self, reason=None, **kwargs):
+        super().at_disconnect(reason=reason, **kwargs)
+        self.channels.at_disconnect()
+
 
 class CharacterChannelMixin(object):
 
     @lazy_property
     def channels(self):
         return CharacterChannelHandler(self)
+
+    def at_post_puppet(self, **kwargs):
+        super().at_post_puppet(**kwargs)
+        self.channels.at_connect()
+
+    def at_post_unpuppet(self, account, session=None, **kwargs):
+        super().at_post_unpuppet(account, session=session, **kwargs)
+        self.channels.mark_seen()
+        self.channels.update_online()
@@ -52,6 +52,14 @@ class AbstractChannelSubscription(SharedMemoryModel):
     db_altname = models.CharField(max_length=255, null=True, blank=False)
     db_muted = models.BooleanField(default=False, null=False, blank=False)
     db_enabled = models.BooleanField(default=True, null=False, blank=False)
+    # Opted in to a replay of missed messages on login.
+    db_catchup = models.BooleanField(default=False, null=False, blank=False)
+    # Id of the last Channel history message this subscription has seen.
+    db_last_seen = models.PositiveIntegerField(default=0, null=False, blank=False)
+    # Receives periodic summaries instead of live messages.
+    db_digest = models.BooleanField(default=False, null=False, blank=False)
+    # Id of the last Channel history message counted in a digest.
+    db_digest_seen = models.PositiveIntegerField(default=0, null=False, blank=False)
 
     class Meta:
         abstract = True
@@ -60,10 +68,14 @@ class AbstractChannelSubscription(SharedMemoryModel):
         self.save(update_fields=['db_codename', 'db_ccodename', 'db_icodename'])
 
     def print_status(self):
-        return 'Mut' if self.db_muted else 'On'
+        if self.db_muted:
+            return 'Mut'
+        return 'Dig' if self.db_digest else 'On'
 
 
 class AccountChannelSubscription(AbstractChannelSubscription):
+    owner_field = 'db_account'
+
     db_account = models.ForeignKey('accounts.AccountDB', related_name='channel_subscriptions', on_delete=models.CASCADE)
     db_channel = models.ForeignKey('comms.ChannelDB', related_name='account_subscriptions', on_delete=models.CASCADE)
 
@@ -79,7 +91,10 @@ class AccountChannelSubscription(AbstractChannelSubscription):
     def owner(self):
         return self.db_account
 
+
 class CharacterChannelSubscription(AbstractChannelSubscription):
+    owner_field = 'db_object'
+
     db_object = models.ForeignKey('objects.ObjectDB', related_name='channel_subscriptions', on_delete=models.CASCADE)
     db_channel = models.ForeignKey('comms.ChannelDB', related_name='character_subscriptions', on_delete=models.CASCADE)
 
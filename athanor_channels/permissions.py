@@ -0,0 +1,129 @@
+from weakref import WeakSet
+
+# Every live PositionCache and ChannelListenerIndex, so changes made outside the Channel System
+# can reach them all.
+_CACHES = WeakSet()
+_INDEXES = WeakSet()
+
+
+def identity(obj):
+    """
+    Hashable key for a database entity: its concrete table and primary key. Account #1 and
+    Object #1 get different keys, and the same row gets the same key whatever its typeclass.
+    """
+    return (obj._meta.concrete_model, obj.pk)
+
+
+def track_index(index):
+    _INDEXES.add(index)
+
+
+def owned_by(user):
+    """
+    Matches the user and, for an Account, the Characters it owns, since pperm() locks on a
+    Character read its Account's permissions.
+    """
+    key = identity(user)
+    is_account = key[0].__name__ == 'AccountDB'
+
+    def match(owner):
+        if (found := identity(owner)) == key:
+            return True
+        return is_account and found[0] is not key[0] and getattr(owner, 'db_account_id', None) == user.pk
+
+    return match
+
+
+def invalidate_all(match=None):
+    """
+    Drops every cached position, then re-evaluates listener positions in every listener index,
+    for the owners match accepts or for everyone.
+    """
+    for cache in list(_CACHES):
+        cache.invalidate()
+    for index in list(_INDEXES):
+        index.refresh_matching(match)
+
+
+def _tags_changed(sender, instance, action, reverse=False, model=None, pk_set=None, **kwargs):
+    """
+    m2m_changed receiver for Account and Object tags. Permissions are tags, so adding, removing
+    or clearing one can change what a lock string sees.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # A permission Tag added to or removed from many entities at once.
+        if getattr(instance, 'db_tagtype', None) == 'permission':
+            invalidate_all()
+        return
+    if pk_set and not model.objects.filter(pk__in=pk_set, db_tagtype='permission').exists():
+        return
+    invalidate_all(owned_by(instance))
+
+
+def _saved(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    post_save receiver for Accounts and Objects. Catches superuser changes, and Characters
+    changing hands (which changes the Account a pperm() lock looks at).
+    """
+    if created:
+        return
+    if update_fields is None or {'is_superuser', 'db_account'}.intersection(update_fields):
+        invalidate_all(owned_by(instance))
+
+
+def connect_signals():
+    """
+    Hooks the receivers above up. Called once the models are ready.
+    """
+    from django.db.models.signals import m2m_changed, post_save
+    from evennia.accounts.models import AccountDB
+    from evennia.objects.models import ObjectDB
+    for model in (AccountDB, ObjectDB):
+        m2m_changed.connect(_tags_changed, sender=model.db_tags.through,
+                            dispatch_uid=f"athanor_channels_tags_{model.__name__}")
+        post_save.connect(_saved, sender=model, dispatch_uid=f"athanor_channels_saved_{model.__name__}")
+
+
+class PositionCache(object):
+    """
+    Memoizes position and access checks for one Channel System.
+
+    Results are keyed on (method, entity, user, position/lock), so a hit is a single dict lookup.
+    Every mutation that can change a result anywhere in the System (lock, grant, revoke, ban,
+    unban, config, moving Channels around) bumps the generation, which drops everything at once.
+    Permission tag and superuser changes do the same through connect_signals(), which also
+    re-evaluates the affected owners in every listener index. Once more than max_entries results
+    are held, they are dropped and the cache starts over.
+    """
+    max_entries = 50000
+
+    def __init__(self):
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.results = dict()
+        _CACHES.add(self)
+
+    def invalidate(self):
+        self.generation += 1
+        self.results.clear()
+
+    def resolve(self, method, entity, user, position, compute):
+        if user is None or not hasattr(user, '_meta'):
+            return compute()
+        key = (method, identity(entity), identity(user), position)
+        try:
+            result = self.results[key]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            if len(self.results) >= self.max_entries:
+                self.results.clear()
+            result = self.results[key] = compute()
+        return result
+
+    def stats(self):
+        return {'generation': self.generation, 'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.results)}
@@ -0,0 +1,74 @@
+from bisect import bisect_left, insort
+
+
+class PrefixIndex(object):
+    """
+    Sorted-array index for resolving names by exact match or by prefix.
+
+    Resolution follows the same rules as athanor.utils.text.partial_match: an exact
+    (case-insensitive) match wins, otherwise the shortest name starting with the text does.
+    Lookups are a bisect plus a walk over the names that share the prefix.
+    """
+
+    def __init__(self, entries=None):
+        self._names = list()
+        self._items = dict()
+        if entries:
+            for name, item in entries:
+                self._items[name.lower()] = item
+            self._names = sorted(self._items.keys())
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name.lower() in self._items
+
+    def add(self, name, item):
+        name = name.lower()
+        if name not in self._items:
+            insort(self._names, name)
+        self._items[name] = item
+
+    def remove(self, name):
+        name = name.lower()
+        if self._items.pop(name, None) is None:
+            return
+        index = bisect_left(self._names, name)
+        if index < len(self._names) and self._names[index] == name:
+            del self._names[index]
+
+    def get(self, name, default=None):
+        return self._items.get(name.lower(), default)
+
+    def matches(self, text):
+        """
+        Yields every item whose name starts with text, in resolution order: the exact match
+        first, then shortest name first (alphabetical among names of equal length).
+        """
+        text = text.lower()
+        start = bisect_left(self._names, text)
+        found = list()
+        for name in self._names[start:]:
+            if not name.startswith(text):
+                break
+            found.append(name)
+        found.sort(key=len)
+        for name in found:
+            yield self._items[name]
+
+    def find(self, text, check=None):
+        """
+        Resolve text to a single item.
+
+        Args:
+            text (str): The name or prefix to look for.
+            check (callable): Optional filter. Items it rejects are skipped.
+
+        Returns:
+            item (any or None): The best match.
+        """
+        for item in self.matches(text):
+            if check is None or check(item):
+                return item
+        return None
@@ -0,0 +1,99 @@
+import time
+
+from athanor_channels.permissions import identity
+
+
+def parse_rate(value):
+    """
+    Parses a rate limit of the form <messages>:<seconds>, such as 5:10.
+
+    Returns:
+        limit (tuple or None): (messages, seconds), or None for 0/off/none.
+    """
+    value = str(value or '').strip().lower()
+    if value in ('', '0', 'off', 'none'):
+        return None
+    messages, sep, seconds = value.partition(':')
+    try:
+        messages, seconds = int(messages), float(seconds)
+    except ValueError:
+        raise ValueError("Rate limits must be <messages>:<seconds>, such as 5:10, or 0 to clear.")
+    if messages < 1 or seconds <= 0:
+        raise ValueError("Rate limits need at least one message over a positive number of seconds.")
+    return (messages, seconds)
+
+
+class TokenBucket(object):
+    __slots__ = ('capacity', 'rate', 'tokens', 'stamp')
+
+    def __init__(self, limit, now):
+        self.capacity, seconds = limit
+        self.rate = self.capacity / seconds
+        self.tokens = float(self.capacity)
+        self.stamp = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return self.tokens
+
+
+class ChannelRateLimiter(object):
+    """
+    Token buckets for one Channel: one shared by everyone speaking, and one per speaker.
+
+    Limits come from the 'speaker_rate' and 'channel_rate' config options, inherited from
+    Category and System when the Channel doesn't set its own. They are re-read only when the
+    System's position cache generation moves, which every config change causes.
+    """
+    max_speakers = 1000
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.generation = None
+        self.speaker_limit = None
+        self.channel_limit = None
+        self.channel_bucket = None
+        self.speakers = dict()
+
+    def refresh(self):
+        if (generation := self.channel.position_cache.generation) == self.generation:
+            return
+        self.generation = generation
+        speaker_limit = self.channel.rate_limit('speaker_rate')
+        channel_limit = self.channel.rate_limit('channel_rate')
+        if speaker_limit != self.speaker_limit:
+            self.speaker_limit = speaker_limit
+            self.speakers.clear()
+        if channel_limit != self.channel_limit:
+            self.channel_limit = channel_limit
+            self.channel_bucket = TokenBucket(channel_limit, time.monotonic()) if channel_limit else None
+
+    def _speaker_bucket(self, speaker, now):
+        key = identity(speaker)
+        if (bucket := self.speakers.get(key, None)) is None:
+            if len(self.speakers) >= self.max_speakers:
+                # Full buckets carry no state worth keeping.
+                for found in [k for k, b in self.speakers.items() if b.refill(now) >= b.capacity]:
+                    del self.speakers[found]
+            bucket = self.speakers[key] = TokenBucket(self.speaker_limit, now)
+        return bucket
+
+    def allow(self, speaker):
+        """
+        Takes a token from the speaker's and the Channel's bucket, if both have one.
+        """
+        self.refresh()
+        if not (self.speaker_limit or self.channel_bucket):
+            return True
+        now = time.monotonic()
+        buckets = list()
+        if self.speaker_limit:
+            buckets.append(self._speaker_bucket(speaker, now))
+        if self.channel_bucket:
+            buckets.append(self.channel_bucket)
+        if not all(bucket.refill(now) >= 1 for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return True
@@ -0,0 +1,234 @@
+import os
+import pickle
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from twisted.internet import threads
+
+from evennia.utils.ansi import strip_ansi
+from evennia.utils.logger import log_trace, log_err
+
+_RE_TOKEN = re.compile(r"\w+")
+_RE_QUERY = re.compile(r'(?P<field>\w+:)?(?:"(?P<phrase>[^"]*)"|(?P<word>\S+))')
+
+
+def tokenize(text):
+    return _RE_TOKEN.findall(strip_ansi(text or '').lower())
+
+
+class SearchQuery(object):
+    """
+    A parsed search string. Bare words and "quoted phrases" must all appear (AND);
+    speaker:<name> restricts by speaker name or codename; page:<number> picks the results page.
+    """
+
+    def __init__(self, text):
+        self.words = list()
+        self.phrases = list()
+        self.speakers = list()
+        self.page = 1
+        for match in _RE_QUERY.finditer(text or ''):
+            field = (match.group('field') or '').lower()
+            value = match.group('phrase') if match.group('phrase') is not None else match.group('word')
+            if field == 'speaker:':
+                self.speakers.append(value.lower())
+            elif field == 'page:' and value.isdigit():
+                self.page = max(int(value), 1)
+            elif match.group('phrase') is not None:
+                tokens = tokenize(value)
+                self.words.extend(tokens)
+                if len(tokens) > 1:
+                    self.phrases.append(tokens)
+            else:
+                self.words.extend(tokenize((match.group('field') or '') + value))
+        if not (self.words or self.speakers):
+            raise ValueError("Nothing to search for!")
+
+    def matches(self, entry):
+        if not self.phrases:
+            return True
+        tokens = tokenize(entry['text'])
+        for phrase in self.phrases:
+            size = len(phrase)
+            if not any(tokens[i:i + size] == phrase for i in range(len(tokens) - size + 1)):
+                return False
+        return True
+
+
+class ChannelSearchIndex(object):
+    """
+    Incremental inverted index over one Channel's history: token -> ascending message ids,
+    plus speaker/codename -> message ids.
+
+    The HistoryWriter feeds it each batch once that batch is on disk, so indexing never happens
+    on the broadcast path. It is saved beside the Channel's log periodically and at shutdown.
+    Loading it, and catching it up from the log, happens in a thread on first search.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self.loaded = False
+        self.dirty = False
+        self.tokens = defaultdict(list)
+        self.speakers = defaultdict(list)
+        self.indexed_id = 0
+        # Entries flushed while a load or rebuild is running.
+        self.unindexed = list()
+        self.building = False
+
+    @property
+    def path(self):
+        return os.path.join(self.history.log.path, 'search.idx')
+
+    def _add(self, tokens, speakers, entry):
+        for token in set(tokenize(entry['text'])):
+            tokens[token].append(entry['id'])
+        for name in {entry.get('speaker'), entry.get('codename')}:
+            if name:
+                speakers[strip_ansi(name).lower()].append(entry['id'])
+
+    def feed(self, entries):
+        if self.building:
+            self.unindexed.extend(entries)
+            return
+        if not self.loaded:
+            # Already on disk; load() will catch up from the log.
+            return
+        for entry in entries:
+            if entry['id'] > self.indexed_id:
+                self._add(self.tokens, self.speakers, entry)
+                self.indexed_id = entry['id']
+                self.dirty = True
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                indexed_id, tokens, speakers = pickle.load(f)
+            return indexed_id, defaultdict(list, tokens), defaultdict(list, speakers)
+        except Exception:
+            log_trace()
+            return 0, defaultdict(list), defaultdict(list)
+
+    def _build(self, saved=False):
+        """
+        Builds an index from the log, starting from the saved index if asked to. Runs in a
+        thread and touches nothing shared.
+        """
+        if saved and os.path.exists(self.path):
+            indexed_id, tokens, speakers = self._read()
+        else:
+            indexed_id, tokens, speakers = 0, defaultdict(list), defaultdict(list)
+        for entry in self.history.log.iter_from(indexed_id + 1):
+            self._add(tokens, speakers, entry)
+            indexed_id = entry['id']
+        return indexed_id, tokens, speakers
+
+    def _start(self, saved):
+        if self.building:
+            raise ValueError("This channel is already being indexed!")
+        self.building = True
+
+        def _swap(result):
+            self.indexed_id, self.tokens, self.speakers = result
+            self.loaded = True
+            self.building = False
+            self.dirty = True
+            unindexed, self.unindexed = self.unindexed, list()
+            self.feed(unindexed)
+
+        def _failed(failure):
+            self.building = False
+            self.unindexed = list()
+            log_err(f"Channel search indexing failed: {failure}")
+
+        return threads.deferToThread(self._build, saved).addCallbacks(_swap, _failed)
+
+    def load(self):
+        """
+        Reads the saved index and catches it up from the log, in a thread.
+
+        Returns:
+            deferred (Deferred): Fires when the index is live.
+        """
+        return self._start(True)
+
+    def ensure(self):
+        if not (self.loaded or self.building):
+            self.load()
+
+    def _write(self, data):
+        os.makedirs(self.history.log.path, exist_ok=True)
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, self.path)
+
+    def _dump(self):
+        self.dirty = False
+        return pickle.dumps((self.indexed_id, dict(self.tokens), dict(self.speakers)))
+
+    def save(self):
+        if not self.loaded or not self.dirty:
+            return
+        self._write(self._dump())
+
+    def save_later(self):
+        """
+        Periodic save. The index is pickled here, but written to disk in a thread.
+        """
+        if not self.loaded or not self.dirty or self.building:
+            return
+        return threads.deferToThread(self._write, self._dump()).addErrback(
+            lambda failure: log_err(f"Channel search index save failed: {failure}"))
+
+    def rebuild(self):
+        """
+        Re-indexes the Channel's entire log in a thread, then swaps the result in.
+
+        Returns:
+            deferred (Deferred): Fires when the new index is live.
+        """
+        return self._start(False).addCallback(lambda result: self.save_later())
+
+    def candidates(self, query):
+        """
+        Message ids that contain every word and match every speaker filter, newest first.
+        """
+        if not self.loaded or self.building:
+            self.ensure()
+            raise ValueError("This channel's history is being indexed. Try again shortly.")
+        lists = [self.tokens.get(word, ()) for word in set(query.words)]
+        if query.speakers:
+            found = set()
+            for name in query.speakers:
+                found.update(self.speakers.get(name, ()))
+            lists.append(sorted(found))
+        if not lists or not all(lists):
+            return list()
+        lists.sort(key=len)
+        result = lists[0]
+        for other in lists[1:]:
+            result = [i for i in result if (pos := bisect_left(other, i)) < len(other) and other[pos] == i]
+            if not result:
+                break
+        return result[::-1]
+
+    def search(self, query, per_page=20):
+        """
+        Returns:
+            results (tuple): (list of matching entries for the requested page, more pages?)
+        """
+        wanted = (query.page - 1) * per_page
+        page = list()
+        matched = 0
+        for message_id in self.candidates(query):
+            if not (entry := self.history.get(message_id)) or not query.matches(entry):
+                continue
+            matched += 1
+            if matched <= wanted:
+                continue
+            if len(page) == per_page:
+                return page, True
+            page.append(entry)
+        return page, False
@@ -0,0 +1,228 @@
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from itertools import islice
+
+# payload length, message id, timestamp
+_HEADER = struct.Struct('<IQd')
+# message id, timestamp, byte offset of the record in its segment
+_INDEX = struct.Struct('<Qdq')
+
+
+class LogSegment(object):
+    """
+    One file of a SegmentedLog, named after the id of its first message, plus a sparse index
+    file recording the offset of every Nth message.
+    """
+
+    def __init__(self, path, first_id):
+        self.path = path
+        self.first_id = first_id
+        self._index = None
+
+    @property
+    def index_path(self):
+        return os.path.splitext(self.path)[0] + '.idx'
+
+    def index(self):
+        if self._index is None:
+            entries = list()
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'rb') as f:
+                    data = f.read()
+                for pos in range(0, len(data) - _INDEX.size + 1, _INDEX.size):
+                    entries.append(_INDEX.unpack_from(data, pos))
+            self._index = entries
+        return self._index
+
+    def first_time(self):
+        if not (index := self.index()):
+            return None
+        return index[0][1]
+
+    def seek_id(self, message_id):
+        index = self.index()
+        pos = bisect_right([entry[0] for entry in index], message_id) - 1
+        return index[pos][2] if pos >= 0 else 0
+
+    def seek_time(self, timestamp):
+        index = self.index()
+        pos = bisect_right([entry[1] for entry in index], timestamp) - 1
+        return index[pos][2] if pos >= 0 else 0
+
+    def records(self, offset=0):
+        """
+        Yields (offset, message id, timestamp, payload) from the memory-mapped segment, starting
+        at offset. Only the records actually read are paged in.
+        """
+        if not os.path.getsize(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                size = len(mapped)
+                while offset + _HEADER.size <= size:
+                    length, message_id, timestamp = _HEADER.unpack_from(mapped, offset)
+                    end = offset + _HEADER.size + length
+                    if end > size:
+                        # A record still being written.
+                        break
+                    yield offset, message_id, timestamp, mapped[offset + _HEADER.size:end]
+                    offset = end
+
+    def write(self, entries, interval, count):
+        """
+        Appends entries and indexes every interval-th record of the segment.
+
+        Returns:
+            count (int): Records written to this segment so far.
+        """
+        index_entries = list()
+        data = bytearray()
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            for entry in entries:
+                payload = json.dumps(entry).encode('utf-8')
+                if not count % interval:
+                    index_entries.append((entry['id'], entry['time'], offset + len(data)))
+                data += _HEADER.pack(len(payload), entry['id'], entry['time'])
+                data += payload
+                count += 1
+            # One write per batch, so a record's header and payload are never split.
+            f.write(data)
+        if index_entries:
+            with open(self.index_path, 'ab') as f:
+                f.write(b''.join(_INDEX.pack(*entry) for entry in index_entries))
+            if self._index is not None:
+                self._index.extend(index_entries)
+        return count
+
+
+class SegmentedLog(object):
+    """
+    Append-only message log for one Channel, split into fixed-size segments.
+
+    Segments rotate when they exceed segment_size bytes or segment_age seconds. Reading is done
+    through memory maps and streaming iterators, so paging through months of history only costs
+    the page being read.
+    """
+
+    def __init__(self, path, segment_size, segment_age, index_interval):
+        self.path = path
+        self.segment_size = segment_size
+        self.segment_age = segment_age
+        self.index_interval = index_interval
+        self.segments = list()
+        self.last_id = 0
+        self._count = 0
+        self.loaded = False
+
+    def load(self):
+        segments = list()
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                base, ext = os.path.splitext(name)
+                if ext == '.seg' and base.isdigit():
+                    segments.append(LogSegment(os.path.join(self.path, name), int(base)))
+        segments.sort(key=lambda seg: seg.first_id)
+        self.segments = segments
+        self.last_id = 0
+        if segments:
+            # A segment is named after the id of its first message, so even an empty one
+            # (rotated, then interrupted before its first write) bounds the ids already used.
+            self.last_id = segments[-1].first_id - 1
+            for segment in reversed(segments):
+                found = None
+                for offset, message_id, timestamp, payload in segment.records(segment.seek_id(2 ** 63)):
+                    found = message_id
+                if found is not None:
+                    self.last_id = max(self.last_id, found)
+                    break
+        # Make sure the next record written gets indexed.
+        self._count = 0
+        self.loaded = True
+
+    def ensure(self):
+        if not self.loaded:
+            self.load()
+
+    def _needs_rotation(self, entry):
+        if not self.segments:
+            return True
+        current = self.segments[-1]
+        if os.path.getsize(current.path) >= self.segment_size:
+            return True
+        if (first_time := current.first_time()) is not None and entry['time'] - first_time >= self.segment_age:
+            return True
+        return False
+
+    def append(self, entries):
+        """
+        Writes a batch of entries. Entries are dicts with at least 'id' and 'time'.
+        """
+        self.ensure()
+        os.makedirs(self.path, exist_ok=True)
+        batch = list()
+        for entry in entries:
+            if self._needs_rotation(entry):
+                if batch:
+                    self._count = self.segments[-1].write(batch, self.index_interval, self._count)
+                    batch = list()
+                segment = LogSegment(os.path.join(self.path, f"{entry['id']:020d}.seg"), entry['id'])
+                open(segment.path, 'ab').close()
+                self.segments.append(segment)
+                self._count = 0
+            batch.append(entry)
+            self.last_id = entry['id']
+            if len(batch) >= self.index_interval:
+                self._count = self.segments[-1].write(batch, self.index_interval, self._count)
+                batch = list()
+        if batch:
+            self._count = self.segments[-1].write(batch, self.index_interval, self._count)
+
+    def iter_from(self, message_id):
+        """
+        Yields entries with an id of message_id or greater, oldest first.
+        """
+        self.ensure()
+        segments = list(self.segments)
+        pos = max(bisect_right([seg.first_id for seg in segments], message_id) - 1, 0)
+        for num, segment in enumerate(segments[pos:]):
+            offset = segment.seek_id(message_id) if not num else 0
+            for offset, found_id, timestamp, payload in segment.records(offset):
+                if found_id >= message_id:
+                    yield json.loads(payload)
+
+    def iter_range(self, start=None, end=None):
+        """
+        Yields entries whose timestamp falls between start and end (inclusive), oldest first.
+        Either bound may be None.
+        """
+        self.ensure()
+        segments = list(self.segments)
+        pos = 0
+        if start is not None:
+            times = [seg.first_time() or 0 for seg in segments]
+            pos = max(bisect_right(times, start) - 1, 0)
+        for num, segment in enumerate(segments[pos:]):
+            offset = segment.seek_time(start) if (start is not None and not num) else 0
+            for offset, found_id, timestamp, payload in segment.records(offset):
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp > end:
+                    return
+                yield json.loads(payload)
+
+    def page(self, before=None, count=50):
+        """
+        Returns up to count entries older than the message id before (or the newest ones).
+        """
+        self.ensure()
+        if before is None:
+            before = self.last_id + 1
+        start = max(before - count, 1)
+        return [entry for entry in islice(self.iter_from(start), before - start) if entry['id'] < before]
+
+    def tail(self, count):
+        return self.page(None, count)
@@ -0,0 +1,138 @@
+import os
+import pickle
+from collections import defaultdict
+from weakref import WeakSet
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from evennia.utils.logger import log_trace, log_info
+
+from athanor_channels.models import ChannelSystemBridge, ChannelCategoryBridge, ChannelBridge
+from athanor_channels.models import AccountChannelSubscription, CharacterChannelSubscription
+
+_VERSION = 1
+
+
+def fingerprint():
+    """
+    Cheap aggregate of everything the listener indexes are derived from. A snapshot is only
+    trusted if this is unchanged since it was written.
+    """
+    result = list()
+    for model in (ChannelSystemBridge, ChannelCategoryBridge, ChannelBridge):
+        found = model.objects.aggregate(count=Count('pk'), top=Max('pk'))
+        result.append((model._meta.label, found['count'], found['top']))
+    for model in (AccountChannelSubscription, CharacterChannelSubscription):
+        found = model.objects.aggregate(count=Count('pk'), top=Max('pk'),
+                                        muted=Count('pk', filter=Q(db_muted=True)),
+                                        disabled=Count('pk', filter=Q(db_enabled=False)),
+                                        digest=Count('pk', filter=Q(db_digest=True)))
+        result.append((model._meta.label, found['count'], found['top'], found['muted'], found['disabled'],
+                       found['digest']))
+    return tuple(result)
+
+
+class ChannelSnapshot(object):
+    """
+    Warm-start copy of the Channel listener indexes.
+
+    Written at shutdown (which includes @reload) and read once on the next start. If the
+    database fingerprint still matches, each Channel's listener index is restored from one bulk
+    query per subscription table instead of a query per Channel, and listener positions are
+    taken from the snapshot for offline owners. Those are re-checked when the owner connects.
+    The file is removed once read, so it only ever bridges a single restart. Any subscription or
+    permission change to a Channel whose index isn't built yet discards that Channel's entry.
+    """
+
+    def __init__(self):
+        self.indexes = WeakSet()
+        # channel id -> (model label, subscription ids, {owner pk: position})
+        self.entries = dict()
+        self.subscriptions = None
+        self.restored = 0
+
+    @property
+    def path(self):
+        return settings.CHANNEL_SNAPSHOT_FILE
+
+    def track(self, index):
+        self.indexes.add(index)
+
+    def save(self):
+        entries = dict()
+        for index in list(self.indexes):
+            if not index.built:
+                continue
+            model = index.channel.subscriptions.model
+            entries[index.channel.id] = (model._meta.label,
+                                         [sub.id for subs in index.subscriptions.values() for sub in subs],
+                                         {owner.pk: position for owner, position in index.positions.items()})
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp = self.path + '.tmp'
+            with open(temp, 'wb') as f:
+                pickle.dump((_VERSION, fingerprint(), entries), f)
+            os.replace(temp, self.path)
+        except Exception:
+            log_trace()
+
+    def load(self):
+        self.entries = dict()
+        self.subscriptions = None
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                version, found, entries = pickle.load(f)
+            os.remove(self.path)
+        except Exception:
+            log_trace()
+            return
+        if version != _VERSION or found != fingerprint():
+            log_info("Channel snapshot is out of date. Rebuilding listener indexes from the database.")
+            return
+        self.entries = entries
+
+    def _fetch(self):
+        ids = defaultdict(list)
+        for label, sub_ids, positions in self.entries.values():
+            ids[label].extend(sub_ids)
+        self.subscriptions = dict()
+        for label, sub_ids in ids.items():
+            model = apps.get_model(label)
+            for sub in model.objects.filter(id__in=sub_ids).select_related(model.owner_field):
+                self.subscriptions[(label, sub.id)] = sub
+
+    def discard(self, channel):
+        """
+        Drops a Channel's entry after something changed that the snapshot doesn't reflect.
+        """
+        self.entries.pop(channel.id, None)
+        if not self.entries:
+            self.subscriptions = None
+
+    def take(self, channel):
+        """
+        Returns:
+            restored (tuple or None): (subscriptions, {owner pk: position}) for the Channel, or
+                None if the snapshot doesn't cover it.
+        """
+        if (entry := self.entries.pop(channel.id, None)) is None:
+            return None
+        if self.subscriptions is None:
+            self._fetch()
+        label, sub_ids, positions = entry
+        subscriptions = list()
+        for sub_id in sub_ids:
+            if not (sub := self.subscriptions.pop((label, sub_id), None)) or sub.db_channel_id != channel.id:
+                return None
+            subscriptions.append(sub)
+        if not self.entries:
+            self.subscriptions = None
+        self.restored += 1
+        return subscriptions, positions
+
+
+CHANNEL_SNAPSHOT = ChannelSnapshot()
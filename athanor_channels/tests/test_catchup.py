@@ -0,0 +1,88 @@
+from unittest import TestCase, mock
+
+from django.test import override_settings
+
+from athanor_channels.channelhandler import AccountChannelHandler
+from athanor_channels.channels.base import AbstractChannel
+
+
+class StubHistory(object):
+
+    def __init__(self, count):
+        self.entries = [{'id': num, 'text': f"Message {num}"} for num in range(1, count + 1)]
+
+    def latest_id(self):
+        return len(self.entries)
+
+    def last(self, count):
+        return self.entries[-count:]
+
+
+class StubChannel(object):
+    render_catchup = AbstractChannel.render_catchup
+
+    def __init__(self, count=5):
+        self.history = StubHistory(count)
+        self.allowed = set()
+        self.banned = set()
+
+    def check_position(self, viewer, position):
+        return viewer in self.allowed
+
+    def is_banned_anywhere(self, viewer):
+        return viewer in self.banned
+
+    def render_prefix(self, recipient, sender, subscription=None):
+        return "[Public]"
+
+    def render_entries(self, viewer, entries, controller=None, subscription=None):
+        return "\n".join(entry['text'] for entry in entries)
+
+
+class StubSubscription(object):
+
+    def __init__(self, channel, muted=False, enabled=True):
+        self.db_channel = channel
+        self.db_muted = muted
+        self.db_enabled = enabled
+        self.db_last_seen = 2
+        self.last_seen = 2
+
+
+@override_settings(CHANNEL_CATCHUP_LIMIT=50)
+class TestCatchUp(TestCase):
+    """
+    Catch-up replays history, so it must apply the same checks as /last.
+    """
+
+    def setUp(self):
+        self.owner = mock.Mock()
+        self.handler = AccountChannelHandler(self.owner)
+        self.channel = StubChannel()
+        self.channel.allowed.add(self.owner)
+
+    def catch_up(self, *subscriptions):
+        with mock.patch.object(self.handler, 'catchup_subscriptions', return_value=list(subscriptions)):
+            self.handler.catch_up()
+        return [call.args[0] for call in self.owner.msg.call_args_list]
+
+    def test_listener_caught_up(self):
+        sent = self.catch_up(StubSubscription(self.channel))
+        self.assertEqual(len(sent), 1)
+        self.assertIn("3 messages since you were last here", sent[0])
+        self.assertIn("Message 5", sent[0])
+
+    def test_banned_gets_nothing(self):
+        self.channel.banned.add(self.owner)
+        subscription = StubSubscription(self.channel)
+        self.assertEqual(self.catch_up(subscription), [])
+        # Still marked as read, so an unban doesn't replay the whole ban.
+        self.assertEqual(subscription.last_seen, 5)
+
+    def test_not_a_listener_gets_nothing(self):
+        self.channel.allowed.clear()
+        self.assertEqual(self.catch_up(StubSubscription(self.channel)), [])
+
+    def test_muted_and_off_get_nothing(self):
+        self.assertEqual(self.catch_up(StubSubscription(self.channel, muted=True),
+                                       StubSubscription(self.channel, enabled=False)), [])
@@ -0,0 +1,47 @@
+from unittest import TestCase, mock
+
+from athanor_channels.commandpool import ChannelCommandPool
+
+
+class StubCommand(object):
+
+    def __init__(self, key, locks, channel_id):
+        self.key = key
+        self.locks = locks
+        self.channel_id = channel_id
+        self.lockhandler = mock.Mock()
+
+
+class StubChannel(object):
+
+    def __init__(self, channel_id, locks):
+        self.id = channel_id
+        self.locks = locks
+
+
+class TestChannelCommandPool(TestCase):
+
+    def setUp(self):
+        self.pool = ChannelCommandPool(StubCommand)
+        self.public = StubChannel(1, "listener:all()")
+        self.staff = StubChannel(2, "listener:perm(Admin)")
+
+    def test_shared_per_channel_and_alias(self):
+        first = self.pool.get(self.public, 'pub')
+        self.assertIs(self.pool.get(self.public, 'PUB'), first)
+        self.assertIsNot(self.pool.get(self.staff, 'pub'), first)
+        self.assertIsNot(self.pool.get(self.public, 'public'), first)
+
+    def test_unused_commands_are_dropped(self):
+        self.pool.get(self.public, 'pub')
+        self.assertFalse(self.pool.commands)
+
+    def test_refresh_locks(self):
+        public = self.pool.get(self.public, 'pub')
+        staff = self.pool.get(self.staff, 'st')
+        self.public.locks = "listener:perm(Builder)"
+        self.pool.refresh_locks(self.public)
+        self.assertEqual(public.locks, "cmd:all();listener:perm(Builder)")
+        public.lockhandler.reset.assert_called_once_with()
+        self.assertEqual(staff.locks, "cmd:all();listener:perm(Admin)")
+        staff.lockhandler.reset.assert_not_called()
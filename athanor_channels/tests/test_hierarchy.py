@@ -0,0 +1,39 @@
+from unittest import TestCase, mock
+
+from athanor_channels.hierarchy import ChannelHierarchy
+from athanor_channels.tests.test_permissions import Stub
+
+
+class StubEntity(Stub):
+    """
+    Compares by pk alone, so a Category and a Channel with the same pk collide as dict keys.
+    """
+
+    def __init__(self, model, pk):
+        super().__init__(model, pk)
+        self.ndb = mock.Mock()
+
+    def __eq__(self, other):
+        return self.pk == other.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class TestFullnames(TestCase):
+
+    def test_category_and_channel_share_pk(self):
+        system = mock.Mock()
+        system.__str__ = mock.Mock(return_value="Account")
+        category = StubEntity('ScriptDB', 7)
+        channel = StubEntity('ChannelDB', 7)
+        category_bridge = mock.Mock(pk=1, db_script=category, db_cname="Public", db_iname="public")
+        channel_bridge = mock.Mock(db_category_id=1, db_channel=channel, db_cname="Chat", db_iname="chat")
+        categories = system.channel_system_bridge.channel_categories.select_related.return_value
+        categories.order_by.return_value = [category_bridge]
+        with mock.patch('athanor_channels.hierarchy.ChannelBridge') as bridges, \
+                mock.patch('athanor_channels.hierarchy.ANSIString', str):
+            bridges.objects.filter.return_value.select_related.return_value.order_by.return_value = [channel_bridge]
+            hierarchy = ChannelHierarchy(system)
+            self.assertEqual(hierarchy.fullname(category), "Account/Public")
+            self.assertEqual(hierarchy.fullname(channel), "Account/Public/Chat")
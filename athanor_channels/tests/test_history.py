@@ -0,0 +1,98 @@
+from unittest import TestCase, mock
+
+from twisted.internet.defer import Deferred
+
+from athanor_channels.history import HistoryWriter
+
+
+class StubSearch(object):
+
+    def __init__(self):
+        self.indexed_id = 0
+        self.fed = list()
+
+    def feed(self, entries):
+        # Same rule as ChannelSearchIndex.feed: anything at or below indexed_id is skipped.
+        for entry in entries:
+            if entry['id'] > self.indexed_id:
+                self.fed.append(entry['id'])
+                self.indexed_id = entry['id']
+
+
+class StubHistory(object):
+
+    def __init__(self):
+        self.pending = list()
+        self.search = StubSearch()
+        self.written = list()
+
+    def take_pending(self):
+        pending, self.pending = self.pending, list()
+        return pending
+
+    def write(self, entries):
+        self.written.extend(entry['id'] for entry in entries)
+
+    def say(self, *ids):
+        self.pending.extend({'id': num} for num in ids)
+
+
+class TestHistoryWriter(TestCase):
+    """
+    A Channel's batches must reach the log and the search index in id order, even when a write
+    is slower than the flush interval.
+    """
+
+    def setUp(self):
+        self.running = list()
+        patcher = mock.patch('athanor_channels.history.threads.deferToThread', side_effect=self.defer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.writer = HistoryWriter()
+        self.writer.start = mock.Mock()
+        self.history = StubHistory()
+
+    def defer(self, func, *args):
+        d = Deferred()
+        self.running.append((d, func, args))
+        return d
+
+    def finish(self):
+        d, func, args = self.running.pop(0)
+        d.callback(func(*args))
+
+    def flush(self, *ids):
+        self.history.say(*ids)
+        self.writer.mark(self.history)
+        self.writer.flush()
+
+    def test_one_write_in_flight(self):
+        self.flush(1, 2)
+        self.flush(3, 4)
+        self.assertEqual(len(self.running), 1)
+        self.finish()
+        self.writer.flush()
+        self.assertEqual(len(self.running), 1)
+        self.finish()
+        self.assertEqual(self.history.written, [1, 2, 3, 4])
+        self.assertEqual(self.history.search.fed, [1, 2, 3, 4])
+
+    def test_failed_write_releases_history(self):
+        self.flush(1)
+        d, func, args = self.running.pop(0)
+        with mock.patch('athanor_channels.history.log_err'):
+            d.errback(IOError("disk full"))
+        self.flush(2)
+        self.assertEqual(len(self.running), 1)
+
+    def test_shutdown_waits(self):
+        self.flush(1)
+        self.history.say(2)
+        self.writer.mark(self.history)
+        with mock.patch.object(self.history.search, 'save', create=True):
+            result = self.writer.flush_now()
+            self.assertIsInstance(result, Deferred)
+            self.assertEqual(self.history.written, [])
+            self.finish()
+        self.assertEqual(self.history.written, [1, 2])
+        self.assertEqual(self.history.search.fed, [1, 2])
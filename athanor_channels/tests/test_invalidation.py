@@ -0,0 +1,122 @@
+from unittest import TestCase, mock
+
+from athanor.gamedb.base import HasOps
+
+from athanor_channels import messages as cmsg
+from athanor_channels.channels.base import HasChanOps
+from athanor_channels.permissions import PositionCache
+from athanor_channels.tests.test_permissions import Stub
+
+
+class StubSystem(object):
+
+    def __init__(self):
+        self.position_cache = PositionCache()
+        self.ban_index = mock.Mock()
+
+
+class StubEntity(HasChanOps):
+    """
+    HasChanOps without a database behind it. Whatever HasOps would do is patched per test.
+    """
+
+    def __init__(self, system, user, channels):
+        self._meta = Stub('ChannelDB', 1)._meta
+        self.pk = 1
+        self.system = system
+        self.user = user
+        self.channels = channels
+        self.attributes = mock.Mock()
+        self.config_msg = mock.Mock()
+
+    def find_user(self, session, user):
+        return self.user
+
+    def get_enactor(self, session):
+        return self.user
+
+    def listener_channels(self):
+        return self.channels
+
+
+class TestMutationsInvalidate(TestCase):
+    """
+    Every HasChanOps path that can change a position or access result must drop the System's
+    cached results and refresh the affected listener indexes.
+    """
+
+    def setUp(self):
+        self.system = StubSystem()
+        self.user = Stub('AccountDB', 1)
+        self.channel = mock.Mock()
+        self.entity = StubEntity(self.system, self.user, [self.channel])
+        with mock.patch.object(HasOps, 'check_position', return_value=True, create=True):
+            self.assertTrue(self.entity.check_position(self.user, 'listener'))
+        self.generation = self.cache.generation
+
+    @property
+    def cache(self):
+        return self.system.position_cache
+
+    def assertInvalidated(self, refreshed=True):
+        self.assertFalse(self.cache.results)
+        self.assertGreater(self.cache.generation, self.generation)
+        if refreshed:
+            self.channel.listener_index.refresh.assert_called()
+
+    def test_cached(self):
+        with mock.patch.object(HasOps, 'check_position', return_value=False, create=True) as check:
+            self.assertTrue(self.entity.check_position(self.user, 'listener'))
+        check.assert_not_called()
+
+    def test_grant(self):
+        with mock.patch.object(HasOps, 'grant', create=True):
+            self.entity.grant(None, 'user', 'speaker')
+        self.assertInvalidated()
+        self.channel.listener_index.refresh.assert_called_with(self.user)
+
+    def test_revoke(self):
+        with mock.patch.object(HasOps, 'revoke', create=True):
+            self.entity.revoke(None, 'user', 'speaker')
+        self.assertInvalidated()
+        self.channel.listener_index.refresh.assert_called_with(self.user)
+
+    def test_ban(self):
+        with mock.patch.object(HasOps, 'ban', create=True):
+            self.entity.ban(None, 'user', '1d')
+        self.assertInvalidated()
+        self.system.ban_index.forget.assert_called_with(self.user)
+
+    def test_unban(self):
+        with mock.patch.object(HasOps, 'unban', create=True):
+            self.entity.unban(None, 'user')
+        self.assertInvalidated()
+        self.system.ban_index.forget.assert_called_with(self.user)
+
+    def test_lock(self):
+        with mock.patch.object(HasOps, 'lock', create=True):
+            self.entity.lock(None, 'listener:all()')
+        self.assertInvalidated()
+        self.channel.listener_index.refresh.assert_called_with(None)
+
+    def test_config(self):
+        with mock.patch.object(HasOps, 'config', create=True):
+            self.entity.config(None, 'something', 'value')
+        self.assertInvalidated(refreshed=False)
+
+    def test_config_rate(self):
+        with mock.patch.object(HasOps, 'check_position', return_value=True, create=True):
+            self.entity.config(None, 'speaker_rate', '5:10')
+        self.entity.attributes.add.assert_called_with('speaker_rate', (5, 10.0), category='channel_rate')
+        self.assertInvalidated(refreshed=False)
+
+    def test_failed_mutation_keeps_cache(self):
+        with mock.patch.object(HasOps, 'grant', side_effect=ValueError("Permission denied."), create=True):
+            with self.assertRaises(ValueError):
+                self.entity.grant(None, 'user', 'speaker')
+        self.assertTrue(self.cache.results)
+
+    def test_quiet(self):
+        with self.entity.quiet():
+            self.assertIs(self.entity.grant_msg, cmsg.Silent)
+        self.assertIs(self.entity.grant_msg, cmsg.Grant)
@@ -0,0 +1,175 @@
+from collections import Counter
+from itertools import count
+from unittest import TestCase, mock
+
+from django.test import override_settings
+
+from athanor_channels import permissions
+from athanor_channels.delivery import DeliveryQueue
+from athanor_channels.listeners import ChannelListenerIndex, build_indexes
+from athanor_channels.tests.test_permissions import _Meta
+
+_IDS = count(1)
+
+
+class StubOwner(object):
+
+    def __init__(self, name, online=True, allowed=True):
+        self._meta = _Meta('AccountDB')
+        self.id = self.pk = next(_IDS)
+        self.name = name
+        self.online = online
+        self.allowed = allowed
+        self.sessions = mock.Mock()
+        self.sessions.count.side_effect = lambda: 1 if self.online else 0
+        self.received = list()
+
+    def msg(self, text, **kwargs):
+        self.received.append(text)
+
+
+class StubSubscription(object):
+
+    def __init__(self, owner, altname=None, muted=False, enabled=True, digest=False):
+        self.id = next(_IDS)
+        self.owner = owner
+        self.db_altname = altname
+        self.db_muted = muted
+        self.db_enabled = enabled
+        self.db_digest = digest
+
+
+class StubSubscriptions(list):
+    model = mock.Mock(owner_field='db_account')
+
+    def select_related(self, *args):
+        return self
+
+
+class StubChannel(object):
+
+    def __init__(self, subscriptions):
+        self.id = next(_IDS)
+        self.subscriptions = StubSubscriptions(subscriptions)
+        self.stats = Counter()
+        self.ndb = mock.Mock()
+
+    def check_position(self, owner, position):
+        return owner.allowed
+
+    def render_key(self, owner, sender, subscription):
+        return subscription.db_altname
+
+    def render_message(self, text, owner, sender, subscription):
+        return f"[{subscription.db_altname or 'Public'}] {text}"
+
+
+class TestOneDeliveryPerOwner(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('athanor_channels.listeners.DIGEST_SCHEDULER')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.many = StubOwner('many')
+        self.one = StubOwner('one')
+        self.some_muted = StubOwner('some_muted')
+        self.all_muted = StubOwner('all_muted')
+        self.offline = StubOwner('offline', online=False)
+        self.denied = StubOwner('denied', allowed=False)
+        self.digest = StubOwner('digest')
+        subscriptions = [StubSubscription(self.many), StubSubscription(self.many, altname='Bob'),
+                         StubSubscription(self.many), StubSubscription(self.one),
+                         StubSubscription(self.some_muted, muted=True), StubSubscription(self.some_muted),
+                         StubSubscription(self.all_muted, muted=True),
+                         StubSubscription(self.all_muted, enabled=False),
+                         StubSubscription(self.offline), StubSubscription(self.offline),
+                         StubSubscription(self.denied), StubSubscription(self.denied),
+                         StubSubscription(self.digest, digest=True), StubSubscription(self.digest, digest=True)]
+        self.channel = StubChannel(subscriptions)
+        self.index = ChannelListenerIndex(self.channel)
+
+    def test_one_subscription_per_owner(self):
+        deliveries = self.index.active_deliveries()
+        self.assertEqual(Counter(sub.owner for sub in deliveries),
+                         Counter({self.many: 1, self.one: 1, self.some_muted: 1}))
+
+    def test_altname_preferred(self):
+        preferred = [sub for sub in self.index.active_deliveries() if sub.owner is self.many]
+        self.assertEqual(preferred[0].db_altname, 'Bob')
+
+    def test_adding_aliases_keeps_one_delivery(self):
+        self.index.ensure()
+        for num in range(5):
+            self.index.add_subscription(StubSubscription(self.one))
+        self.assertEqual(sum(1 for sub in self.index.active_deliveries() if sub.owner is self.one), 1)
+
+    def test_altname_change_moves_preferred(self):
+        self.index.ensure()
+        sub = StubSubscription(self.one)
+        self.index.add_subscription(sub)
+        sub.db_altname = 'Alice'
+        self.index.update_subscription(sub)
+        self.assertIn(sub, self.index.active_deliveries())
+
+    def test_coming_online(self):
+        self.index.ensure()
+        self.offline.online = True
+        self.index.set_online(self.offline, True)
+        self.assertEqual(sum(1 for sub in self.index.active_deliveries() if sub.owner is self.offline), 1)
+
+    def broadcast(self, text):
+        queue = DeliveryQueue()
+        with mock.patch.object(queue, 'schedule'):
+            queue.enqueue(self.channel, text, None, self.index.active_deliveries())
+            queue.drain()
+
+    @override_settings(CHANNEL_COALESCE_WINDOW=0, CHANNEL_SESSION_BUDGET=0, CHANNEL_DELIVERY_CHUNK=50,
+                       CHANNEL_DELIVERY_SLICE=1.0)
+    def test_broadcast_received_once(self):
+        self.broadcast("Hello!")
+        self.assertEqual(self.many.received, ["[Bob] Hello!"])
+        self.assertEqual(self.one.received, ["[Public] Hello!"])
+        self.assertEqual(self.some_muted.received, ["[Public] Hello!"])
+        for owner in (self.all_muted, self.offline, self.denied, self.digest):
+            self.assertEqual(owner.received, list())
+
+    @override_settings(CHANNEL_COALESCE_WINDOW=0, CHANNEL_SESSION_BUDGET=0, CHANNEL_DELIVERY_CHUNK=50,
+                       CHANNEL_DELIVERY_SLICE=1.0)
+    def test_permission_change_reaches_broadcast(self):
+        self.index.ensure()
+        tags = mock.Mock()
+        tags.objects.filter.return_value.exists.return_value = True
+        # Granted a permission outside the Channel System...
+        self.denied.allowed = True
+        permissions._tags_changed(None, self.denied, 'post_add', model=tags, pk_set={1})
+        # ...and one taken away.
+        self.one.allowed = False
+        permissions._tags_changed(None, self.one, 'post_remove', model=tags, pk_set={1})
+        self.broadcast("Hello!")
+        self.assertEqual(self.denied.received, ["[Public] Hello!"])
+        self.assertEqual(self.one.received, list())
+
+
+class TestBuildIndexes(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('athanor_channels.listeners.DIGEST_SCHEDULER')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_query_for_many(self):
+        owner = StubOwner('owner')
+        channels = [StubChannel([]) for num in range(3)]
+        for channel in channels:
+            channel.listener_index = ChannelListenerIndex(channel)
+        sub = StubSubscription(owner)
+        sub.db_channel_id = channels[1].id
+        model = StubSubscriptions.model
+        model.objects.filter.return_value.select_related.return_value = [sub]
+        model.objects.filter.reset_mock()
+        build_indexes(channels)
+        build_indexes(channels)
+        model.objects.filter.assert_called_once_with(db_channel__in=channels)
+        self.assertTrue(all(channel.listener_index.built for channel in channels))
+        self.assertEqual(channels[1].listener_index.active_listeners(), {sub})
+        self.assertFalse(channels[0].listener_index.active_listeners())
@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from evennia.utils.test_resources import EvenniaTest
+
+from athanor.gamedb.base import HasOps
+
+from athanor_channels.channels.account import AccountChannelSystem, AccountChannelCategory, AccountChannel
+
+
+class TestChannelListQueries(EvenniaTest):
+    """
+    Listing Channels must cost the same number of queries however many Channels are listed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.system = AccountChannelSystem.create_channel_system(
+            "Test Channels", "athanor_channels.channels.account.AccountChannelCategory",
+            "athanor_channels.channels.account.AccountChannel", "athanor_channels.commands.account.AccountChannelCommand")
+        category = AccountChannelCategory.create_channel_category(self.system, "Public")
+        self.channels = [AccountChannel.create_channel(category, f"Channel {num}") for num in range(50)]
+        # Loads Evennia's own caches (attributes, tags) for every entity, so only the Channel
+        # System's caches differ between the listings measured below.
+        self.system.channel_list_data(self.account, self.channels)
+
+    def make_cold(self):
+        self.system.ndb.ban_index = None
+        self.system.position_cache.invalidate()
+        for channel in self.channels:
+            channel.listener_index.built = False
+
+    def count_queries(self, channels):
+        with CaptureQueriesContext(connection) as context:
+            self.system.channel_list_data(self.account, channels)
+        return len(context)
+
+    def test_constant_queries_cold(self):
+        self.make_cold()
+        few = self.count_queries(self.channels[:5])
+        self.make_cold()
+        many = self.count_queries(self.channels)
+        self.assertEqual(few, many)
+
+    def test_constant_queries_warm(self):
+        few = self.count_queries(self.channels[:5])
+        many = self.count_queries(self.channels)
+        self.assertEqual(few, many)
+
+    def test_banned_listed(self):
+        banned = set()
+
+        def ban(entity, session, user, duration):
+            banned.add((entity.id, user.id))
+
+        def is_banned(entity, user):
+            return (entity.id, user.id) in banned
+
+        target = self.channels[3]
+        # Already known to be banned nowhere, so the ban must make the System forget that.
+        self.assertFalse(any(self.system.ban_index.banned_map(self.account, self.channels).values()))
+        with mock.patch.object(HasOps, 'ban', ban), mock.patch.object(HasOps, 'is_banned', is_banned), \
+                mock.patch.object(AccountChannel, 'find_user', return_value=self.account):
+            target.ban(self.session, self.account.key, '1d')
+            rows = self.system.channel_list_data(self.account, self.channels)
+        self.assertEqual([row[0] for row in rows if row[2]], [target])
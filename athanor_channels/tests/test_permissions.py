@@ -0,0 +1,160 @@
+from unittest import TestCase, mock
+
+from athanor_channels import permissions
+from athanor_channels.permissions import PositionCache, identity
+
+
+# Stand-ins for the concrete models, by name.
+_MODELS = {name: type(name, (object,), {}) for name in ('AccountDB', 'ObjectDB', 'ChannelDB', 'ScriptDB')}
+
+
+class _Meta(object):
+
+    def __init__(self, model):
+        self.concrete_model = _MODELS[model]
+
+
+class Stub(object):
+    """
+    Just enough of a database entity for identity().
+    """
+
+    def __init__(self, model, pk, account=None):
+        self._meta = _Meta(model)
+        self.pk = pk
+        if account is not None:
+            self.db_account_id = account.pk
+
+
+class StubIndex(object):
+
+    def __init__(self, owners):
+        self.owners = owners
+        self.refreshed = list()
+        permissions.track_index(self)
+
+    def refresh_matching(self, match=None):
+        self.refreshed.extend(owner for owner in self.owners if match is None or match(owner))
+
+
+class TestPositionCache(TestCase):
+
+    def setUp(self):
+        self.cache = PositionCache()
+        self.channel = Stub('ChannelDB', 1)
+        self.user = Stub('AccountDB', 1)
+        self.compute = mock.Mock(return_value=True)
+
+    def resolve(self, user=None, position='listener'):
+        return self.cache.resolve('check_position', self.channel, user or self.user, position, self.compute)
+
+    def test_hit_skips_compute(self):
+        self.assertTrue(self.resolve())
+        self.assertTrue(self.resolve())
+        self.assertEqual(self.compute.call_count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_is_per_table(self):
+        self.resolve()
+        self.resolve(user=Stub('ObjectDB', 1))
+        self.assertEqual(self.compute.call_count, 2)
+        self.assertNotEqual(identity(self.user), identity(Stub('ObjectDB', 1)))
+
+    def test_key_is_per_position(self):
+        self.resolve(position='listener')
+        self.resolve(position='speaker')
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_unkeyable_user_is_not_cached(self):
+        self.cache.resolve('check_position', self.channel, None, 'listener', self.compute)
+        self.cache.resolve('check_position', self.channel, None, 'listener', self.compute)
+        self.assertEqual(self.compute.call_count, 2)
+        self.assertFalse(self.cache.results)
+
+    def test_invalidate(self):
+        self.resolve()
+        generation = self.cache.generation
+        self.cache.invalidate()
+        self.assertEqual(self.cache.generation, generation + 1)
+        self.resolve()
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_bounded(self):
+        self.cache.max_entries = 10
+        for pk in range(25):
+            self.resolve(user=Stub('AccountDB', pk))
+        self.assertLessEqual(len(self.cache.results), 10)
+
+    def test_invalidate_all(self):
+        other = PositionCache()
+        self.resolve()
+        other.resolve('check_position', self.channel, self.user, 'listener', self.compute)
+        permissions.invalidate_all()
+        self.assertFalse(self.cache.results)
+        self.assertFalse(other.results)
+
+
+class TestSignals(TestCase):
+
+    def setUp(self):
+        self.cache = PositionCache()
+        self.account = Stub('AccountDB', 1)
+        self.character = Stub('ObjectDB', 5, account=self.account)
+        self.stranger = Stub('ObjectDB', 1)
+        self.index = StubIndex([self.account, self.character, self.stranger])
+        self.cache.resolve('check_position', Stub('ChannelDB', 1), self.account, 'listener', lambda: True)
+        self.tags = mock.Mock()
+
+    def tags_changed(self, action, pk_set, permission, instance=None):
+        self.tags.objects.filter.return_value.exists.return_value = permission
+        permissions._tags_changed(None, instance or self.account, action, model=self.tags, pk_set=pk_set)
+
+    def test_permission_added(self):
+        self.tags_changed('post_add', {1}, True)
+        self.assertFalse(self.cache.results)
+
+    def test_permission_removed(self):
+        self.tags_changed('post_remove', {1}, True)
+        self.assertFalse(self.cache.results)
+
+    def test_tags_cleared(self):
+        self.tags_changed('post_clear', None, False)
+        self.assertFalse(self.cache.results)
+
+    def test_other_tag_ignored(self):
+        self.tags_changed('post_add', {1}, False)
+        self.assertTrue(self.cache.results)
+
+    def test_pre_action_ignored(self):
+        self.tags_changed('pre_add', {1}, True)
+        self.assertTrue(self.cache.results)
+
+    def test_account_permission_refreshes_its_characters(self):
+        self.tags_changed('post_add', {1}, True)
+        self.assertEqual(self.index.refreshed, [self.account, self.character])
+
+    def test_character_permission_refreshes_only_it(self):
+        self.tags_changed('post_remove', {1}, True, instance=self.character)
+        self.assertEqual(self.index.refreshed, [self.character])
+
+    def test_permission_tag_on_many(self):
+        tag = mock.Mock(db_tagtype='permission')
+        permissions._tags_changed(None, tag, 'post_add', reverse=True, model=mock.Mock(), pk_set={1, 2})
+        self.assertEqual(self.index.refreshed, [self.account, self.character, self.stranger])
+
+    def test_other_tag_leaves_indexes(self):
+        self.tags_changed('post_add', {1}, False)
+        self.assertEqual(self.index.refreshed, [])
+
+    def test_superuser_saved(self):
+        permissions._saved(None, Stub('AccountDB', 1), update_fields={'is_superuser'})
+        self.assertFalse(self.cache.results)
+
+    def test_puppet_changed_hands(self):
+        permissions._saved(None, Stub('ObjectDB', 1), update_fields={'db_account'})
+        self.assertFalse(self.cache.results)
+
+    def test_unrelated_save_ignored(self):
+        permissions._saved(None, Stub('AccountDB', 1), update_fields={'db_key'})
+        permissions._saved(None, Stub('AccountDB', 2), created=True)
+        self.assertTrue(self.cache.results)
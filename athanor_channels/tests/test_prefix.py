@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from athanor_channels.prefix import PrefixIndex
+
+
+class TestPrefixIndex(TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex([(name, name) for name in ('Public', 'Pub', 'Publicity', 'Puzzle', 'Staff',
+                                                           'Stage', 'Stag')])
+
+    def test_exact_wins(self):
+        self.assertEqual(self.index.find('pub'), 'Pub')
+        self.assertEqual(self.index.find('PUBLIC'), 'Public')
+
+    def test_exact_wins_over_shorter_prefix_match(self):
+        index = PrefixIndex([('abcd', 'abcd'), ('abc', 'abc'), ('abcde', 'abcde')])
+        self.assertEqual(index.find('abcd'), 'abcd')
+
+    def test_shortest_prefix(self):
+        self.assertEqual(self.index.find('publ'), 'Public')
+        self.assertEqual(self.index.find('p'), 'Pub')
+
+    def test_ties_are_alphabetical(self):
+        # Stag is shortest; without it, Stage and Staff tie on length.
+        self.assertEqual(self.index.find('sta'), 'Stag')
+        self.index.remove('stag')
+        self.assertEqual(self.index.find('sta'), 'Staff')
+
+    def test_matches_order(self):
+        self.assertEqual(list(self.index.matches('pu')), ['Pub', 'Public', 'Puzzle', 'Publicity'])
+
+    def test_check_skips(self):
+        self.assertEqual(self.index.find('pub', check=lambda item: item != 'Pub'), 'Public')
+        self.assertIsNone(self.index.find('pub', check=lambda item: False))
+
+    def test_no_match(self):
+        self.assertIsNone(self.index.find('x'))
+        self.assertIsNone(PrefixIndex().find('a'))
+
+    def test_add_replace_remove(self):
+        self.index.add('Pubs', 'Pubs')
+        self.assertEqual(self.index.find('pubs'), 'Pubs')
+        self.index.add('PUB', 'replaced')
+        self.assertEqual(self.index.find('pub'), 'replaced')
+        self.assertEqual(len(self.index), 8)
+        self.index.remove('pub')
+        self.index.remove('missing')
+        self.assertNotIn('pub', self.index)
+        self.assertEqual(self.index.find('pub'), 'Pubs')
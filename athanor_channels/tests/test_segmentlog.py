@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from athanor_channels.segmentlog import SegmentedLog
+
+
+def entries(start, end):
+    return [{'id': num, 'time': float(num), 'text': f"Message {num}"} for num in range(start, end)]
+
+
+class TestSegmentedLog(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def make(self):
+        return SegmentedLog(self.path, 256, 10 ** 9, 4)
+
+    def test_round_trip(self):
+        log = self.make()
+        log.append(entries(1, 40))
+        self.assertGreater(len(log.segments), 1)
+        reloaded = self.make()
+        reloaded.load()
+        self.assertEqual(reloaded.last_id, 39)
+        self.assertEqual([entry['id'] for entry in reloaded.iter_from(1)], list(range(1, 40)))
+        self.assertEqual([entry['id'] for entry in reloaded.tail(5)], list(range(35, 40)))
+
+    def test_empty_trailing_segment(self):
+        self.make().append(entries(1, 40))
+        open(os.path.join(self.path, f"{40:020d}.seg"), 'ab').close()
+        log = self.make()
+        log.load()
+        self.assertEqual(log.last_id, 39)
+
+    def test_only_empty_segments(self):
+        open(os.path.join(self.path, f"{7:020d}.seg"), 'ab').close()
+        log = self.make()
+        log.load()
+        self.assertEqual(log.last_id, 6)
+
+    def test_batches_continue(self):
+        log = self.make()
+        log.append(entries(1, 10))
+        log.append(entries(10, 20))
+        self.assertEqual([entry['id'] for entry in log.iter_from(1)], list(range(1, 20)))
+        self.assertEqual([entry['id'] for entry in log.iter_from(13)], list(range(13, 20)))
@@ -0,0 +1,128 @@
+"""
+Compares the memory held by one alias Command per subscription against ChannelCommandPool,
+which shares one Command per (Channel, alias).
+
+Evennia isn't needed. StubCommand stands in for a Command: it keeps its keyword arguments,
+parses its lock string into a handler the way Evennia's LockHandler does, and (like the alias
+Commands before pooling) formats its own help text. The numbers are an approximation of the
+real Command's footprint, but the ratio between the two layouts is what matters.
+
+    python benchmarks/bench_command_pool.py
+"""
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from athanor_channels.commandpool import ChannelCommandPool
+
+_DOC = """
+Channel alias {key} of the {system_key} Channel System.
+
+Usage:
+    {key} <message>
+    {key}/who
+    {key}/leave
+    {key}/title <title>
+    {key}/altname <name>
+    {key}/codename <name>
+    {key}/mute, {key}/unmute, {key}/on, {key}/off
+    {key}/last [<count>]
+"""
+
+
+class StubLockHandler(object):
+
+    def __init__(self, storage):
+        self.locks = dict()
+        for part in storage.split(';'):
+            access_type, sep, funcs = part.partition(':')
+            if sep:
+                self.locks[access_type.strip()] = ([func.strip() for func in funcs.split(' and ')], part)
+
+    def reset(self):
+        pass
+
+
+class StubCommand(object):
+    system_key = 'account'
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.aliases = list()
+        self.lock_storage = self.locks
+        self.lockhandler = StubLockHandler(self.locks)
+
+
+class PerSubscriptionCommand(StubCommand):
+    """
+    The layout before pooling: every subscription built its own Command.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__doc__ = _DOC.format(key=self.key, system_key=self.system_key)
+
+
+class StubChannel(object):
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.locks = f"listener:all();speaker:all();moderator:pperm(Moderator);operator:pperm(Admin);c{channel_id}"
+
+
+def make_subscriptions(count, channels, rng):
+    """
+    Most people use a Channel's usual alias; one in ten picks their own.
+    """
+    subscriptions = list()
+    for num in range(count):
+        channel = rng.choice(channels)
+        alias = f"c{channel.id}" if rng.random() < 0.9 else f"alias{num}"
+        subscriptions.append((channel, alias))
+    return subscriptions
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, after - before
+
+
+def per_subscription(subscriptions):
+    # One cmdset (list) per subscription's owner, each with its own Command.
+    return [[PerSubscriptionCommand(key=alias, locks="cmd:all();%s" % channel.locks, subscription=num)]
+            for num, (channel, alias) in enumerate(subscriptions)]
+
+
+def pooled(subscriptions):
+    pool = ChannelCommandPool(StubCommand)
+    return pool, [[pool.get(channel, alias)] for channel, alias in subscriptions]
+
+
+def main(sizes=(100, 1000, 10000), channel_count=10):
+    rng = random.Random(0)
+    channels = [StubChannel(num) for num in range(1, channel_count + 1)]
+    print(f"Alias Command memory, {channel_count} channels, 90% on the usual alias")
+    print(f"{'subs':>6} {'per-sub (KiB)':>14} {'pooled (KiB)':>13} {'commands':>9} {'saved':>6}")
+    for size in sizes:
+        subscriptions = make_subscriptions(size, channels, rng)
+        kept, separate = measure(lambda: per_subscription(subscriptions))
+        del kept
+        (pool, cmdsets), shared = measure(lambda: pooled(subscriptions))
+        print(f"{size:>6} {separate / 1024:>14.1f} {shared / 1024:>13.1f} {len(pool.commands):>9} "
+              f"{1 - shared / separate:>6.0%}")
+        del pool, cmdsets
+
+
+if __name__ == '__main__':
+    main()
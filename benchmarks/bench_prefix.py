@@ -0,0 +1,61 @@
+"""
+Compares PrefixIndex.find with a linear partial_match over 10, 100 and 1000 names.
+
+Uses athanor.utils.text.partial_match when athanor is installed, otherwise a copy of its rules
+(exact match first, then the shortest name starting with the text).
+
+    python benchmarks/bench_prefix.py
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from athanor_channels.prefix import PrefixIndex
+
+try:
+    from athanor.utils.text import partial_match
+    SOURCE = 'athanor.utils.text.partial_match'
+except ImportError:
+    SOURCE = 'reference partial_match'
+
+    def partial_match(match_text, candidates):
+        candidate_list = sorted(candidates, key=lambda item: len(str(item)))
+        for candidate in candidate_list:
+            if match_text.lower() == str(candidate).lower():
+                return candidate
+        for candidate in candidate_list:
+            if str(candidate).lower().startswith(match_text.lower()):
+                return candidate
+        return None
+
+
+def make_names(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12))))
+    return sorted(names)
+
+
+def main(sizes=(10, 100, 1000), lookups=200, repeat=5):
+    rng = random.Random(0)
+    print(f"PrefixIndex.find vs {SOURCE}, {lookups} lookups, best of {repeat}")
+    print(f"{'names':>6} {'linear (us)':>12} {'index (us)':>11} {'speedup':>8}")
+    for size in sizes:
+        names = make_names(size, rng)
+        index = PrefixIndex([(name, name) for name in names])
+        queries = [name[:rng.randint(1, len(name))] for name in rng.choices(names, k=lookups)]
+        for query in queries:
+            if partial_match(query, names) != index.find(query):
+                raise AssertionError(f"Results differ for {query!r}")
+        linear = min(timeit.repeat(lambda: [partial_match(q, names) for q in queries], number=1, repeat=repeat))
+        indexed = min(timeit.repeat(lambda: [index.find(q) for q in queries], number=1, repeat=repeat))
+        print(f"{size:>6} {linear / lookups * 1e6:>12.2f} {indexed / lookups * 1e6:>11.2f} "
+              f"{linear / indexed:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()